@@ -0,0 +1,161 @@
+"""Benchmarks for the calculator's hot paths.
+
+    python -m benchmarks.run                      # time everything, compare with the baseline
+    python -m benchmarks.run --quick              # skip the largest sizes
+    python -m benchmarks.run --save-baseline      # store this machine's numbers as the baseline
+
+Every stage of a rerun of ``streamlit_app.py`` is timed on its own (scenario
+summary, the three projections, the annuity factor, the sensitivity grid,
+figure builds), along with the import time of a fresh process, batch
+throughput and Monte Carlo path counts. Results are written as JSON (seconds
+per call, best of several repeats). A stage that is slower than its baseline by
+more than ``--tolerance`` is reported and makes the run fail.
+"""
+from datetime import date
+from pathlib import Path
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from pension import annuity, batch, cache, engine, montecarlo, sensitivity, solver
+
+BASELINE = Path(__file__).with_name('baseline.json')
+
+# the app defaults, with some money in them
+SCENARIO = engine.Scenario(date(1980, 1, 1), 2500.0, 30000.0, 65, 100, 0.038, 0.038, 0.038, 0.0, 0.1015, 0.1015, date(2023, 6, 15))
+
+
+def clients(n, seed=0):
+    """``n`` reproducible random scenarios as batch.evaluate keyword arguments."""
+    rng = np.random.default_rng(seed)
+    return dict(birth_date=np.datetime64('1960-01-01') + rng.integers(0, 365 * 35, n),
+                monthly_cost_now_net=rng.uniform(1000, 5000, n), initial_amount_for_pension=rng.uniform(0, 1e5, n),
+                retirement_age=rng.integers(62, 70, n), life_expectancy=rng.integers(85, 100, n),
+                inf_annual_post=rng.uniform(0.01, 0.05, n), growth_pre_retirement=rng.uniform(0, 0.04, n),
+                growth_post_retirement=rng.uniform(0, 0.04, n), tax_rate=rng.uniform(0, 0.3, n),
+                market_rate_pre_retirement=rng.uniform(0.04, 0.12, n), market_rate_post_retirement=rng.uniform(0.02, 0.08, n),
+                today_date=date(2023, 6, 15))
+
+
+def timeit(func, min_time=0.2, repeat=5):
+    """Best seconds per call of ``func`` over ``repeat`` rounds of at least ``min_time``."""
+    func()
+    start = time.perf_counter()
+    func()
+    once = time.perf_counter() - start
+    number = max(1, int(min_time / max(once, 1e-9)))
+    best = once
+    for _ in range(repeat if once < min_time else 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def single_stages():
+    s = SCENARIO
+    p = engine.summarize(s)
+    stages = {
+        'single.summarize': lambda: engine.summarize(s),
+        'single.pension_plan': lambda: engine.project_pension_plan(s, p),
+        'single.pension_balance': lambda: engine.project_pension_balance(s, p),
+        'single.pre_pension_balance': lambda: engine.project_pre_pension_balance(s, p),
+        'single.project': lambda: engine.project(s),
+        'single.project_monthly': lambda: engine.project(s._replace(periods_per_year=12)),
+        'single.schedules': lambda: engine.schedules(s),
+        'single.schedules_monthly': lambda: engine.schedules(s._replace(periods_per_year=12)),
+        'single.project_cached': lambda: cache.project(s),
+        'single.solve': lambda: solver.solve(s),
+        'sensitivity.cold': lambda: (sensitivity._rows.clear(), sensitivity.surface(s)),
+        'sensitivity.axis_change': lambda: sensitivity.surface(s._replace(market_rate_pre_retirement=0.05, retirement_age=60)),
+    }
+    table = annuity.factor_table()
+    stages['single.annuity_factor'] = lambda: annuity.growing_annuity_factor(s.market_rate_post_retirement, s.growth_post_retirement, p.count_down_years)
+    # the table only helps on its grid, which the app's default 10.15% / 3.8% is not
+    stages['single.annuity_factor_table_on_grid'] = lambda: table(0.10, 0.0375, p.count_down_years)
+    stages['single.annuity_factor_table_off_grid'] = lambda: table(s.market_rate_post_retirement, s.growth_post_retirement, p.count_down_years)
+    stages['startup.import'] = lambda: subprocess.run([sys.executable, '-c', 'import pension.cache, pension.render, pension.sensitivity'], check=True)
+    try:
+        import plotly  # noqa: F401
+    except ImportError:
+        return stages
+    from pension import render
+
+    def figures(schedules):
+        frames = ((schedules.pension_plan, 'CF'), (schedules.pension_balance, 'InflatedOutflow'),
+                  (schedules.pre_pension_balance, 'Depositions'))
+        return [render.schedule_figure(f.Age, f.column(column), f.Balance, year=f.year, periods_per_year=f.periods_per_year)
+                for f, column in frames]
+
+    annual, monthly = engine.schedules(s), engine.schedules(s._replace(periods_per_year=12))
+    stages['render.figures'] = lambda: figures(annual)
+    stages['render.figures_monthly'] = lambda: figures(monthly)
+    stages['render.figure_json'] = figures(annual)[0].to_json
+    stages['render.figure_json_monthly'] = figures(monthly)[0].to_json
+    return stages
+
+
+def batch_stages(sizes):
+    stages = {}
+    for n in sizes:
+        arguments = clients(n)
+        stages[f'batch.evaluate.{n}'] = lambda a=arguments: batch.evaluate(**a)
+    return stages
+
+
+def montecarlo_stages(paths):
+    return {f'montecarlo.{n}': lambda n=n: montecarlo.simulate(SCENARIO, paths=n, seed=0) for n in paths}
+
+
+def run(quick=False):
+    stages = single_stages()
+    stages.update(batch_stages([1_000, 100_000] if quick else [1_000, 100_000, 1_000_000]))
+    stages.update(montecarlo_stages([1_000, 10_000] if quick else [1_000, 10_000, 100_000]))
+    results = {}
+    for name, func in stages.items():
+        results[name] = timeit(func, min_time=0.05 if quick else 0.2)
+        print(f"{name:32s} {results[name] * 1e3:12.3f} ms", file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Names of the stages slower than ``baseline`` by more than ``tolerance``."""
+    return [name for name, seconds in results.items()
+            if name in baseline and seconds > baseline[name] * (1 + tolerance)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run', description="Time the calculator's hot paths.")
+    parser.add_argument('--output', metavar='PATH', help="write the results as JSON to this file")
+    parser.add_argument('--baseline', metavar='PATH', default=BASELINE, help="baseline JSON to compare with (default: %(default)s)")
+    parser.add_argument('--save-baseline', action='store_true', help="store the results as the new baseline instead of comparing")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown against the baseline (default: %(default)s)")
+    parser.add_argument('--quick', action='store_true', help="skip the largest batch and Monte Carlo sizes")
+    args = parser.parse_args(argv)
+
+    report = {'python': platform.python_version(), 'machine': platform.machine(), 'numpy': np.__version__,
+              'results': run(args.quick)}
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + '\n')
+    if args.save_baseline:
+        Path(args.baseline).write_text(json.dumps(report, indent=2) + '\n')
+        return 0
+    if not Path(args.baseline).exists():
+        print(f"no baseline at {args.baseline}; run with --save-baseline first", file=sys.stderr)
+        return 0
+
+    baseline = json.loads(Path(args.baseline).read_text())['results']
+    regressions = compare(report['results'], baseline, args.tolerance)
+    for name in regressions:
+        print(f"REGRESSION {name}: {report['results'][name] * 1e3:.3f} ms vs {baseline[name] * 1e3:.3f} ms", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,2 @@
+"""Computation behind the pension planning calculator, usable without Streamlit."""
+from pension.engine import Scenario, Plan, Projection, scenario, summarize, project
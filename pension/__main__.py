@@ -0,0 +1,3 @@
+from pension.cli import main
+
+main()
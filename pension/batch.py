@@ -0,0 +1,127 @@
+"""Evaluate many scenarios at once.
+
+Every argument of :func:`evaluate` is a column: a scalar or an array, broadcast
+against the others, so a whole book of clients is handled by a few NumPy
+expressions instead of one engine call per client.
+"""
+from datetime import datetime
+from typing import NamedTuple
+
+import numpy as np
+
+from pension import engine, solver
+from pension.annuity import growing_annuity_factor
+
+
+class Batch(NamedTuple):
+    """Per-row results of :func:`evaluate`.
+
+    Rows whose retirement is less than two years away, or whose terminal year is
+    not after the retirement year, are NaN (the engine raises for them instead).
+    Rows already funded by their initial amount need no deposit: they are 0 and
+    flagged ``overfunded`` (the engine reports -1 for them instead).
+    """
+    age: np.ndarray
+    years_to_retirement: np.ndarray
+    count_down_years: np.ndarray
+    annual_needed_at_retirement_gross: np.ndarray
+    pv_pension_growing_annuity: np.ndarray
+    pv_pension_most_recent_birthday: np.ndarray
+    initial_annual_deposit_amount: np.ndarray
+    monthly_deposit_amount: np.ndarray
+    overfunded: np.ndarray
+
+
+def _month_day(dates):
+    """``month * 32 + day`` of datetime64[D] values, which orders like (month, day)."""
+    months = dates.astype('datetime64[M]')
+    month = months.astype(np.int64) % 12 + 1
+    day = (dates - months.astype('datetime64[D]')).astype(np.int64) + 1
+    return month * 32 + day
+
+
+def ages(birth_date, today_date):
+    """Completed years between ``birth_date`` and ``today_date`` (both datetime64-like)."""
+    birth_date = np.asarray(birth_date, dtype='datetime64[D]')
+    today_date = np.asarray(today_date, dtype='datetime64[D]')
+    years = today_date.astype('datetime64[Y]').astype(np.int64) - birth_date.astype('datetime64[Y]').astype(np.int64)
+    return years - (_month_day(today_date) < _month_day(birth_date))
+
+
+def evaluate(birth_date, monthly_cost_now_net, initial_amount_for_pension, retirement_age, life_expectancy,
+             inf_annual_post, growth_pre_retirement, growth_post_retirement, tax_rate,
+             market_rate_pre_retirement, market_rate_post_retirement, today_date=None):
+    """Required deposits and PVs for every row, with the same arguments as ``engine.scenario``.
+
+    Unlike the engine, a return equal to its growth rate is allowed (the
+    annuity factor falls back to its limit).
+    """
+    if today_date is None:
+        today_date = datetime.now().date()
+    age = ages(birth_date, today_date)
+    retirement_age = np.asarray(retirement_age)
+    years_to_retirement = retirement_age - age
+    count_down_years = np.asarray(life_expectancy) - retirement_age
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        annual_needed_at_retirement_gross = (12 * np.asarray(monthly_cost_now_net, dtype=float)
+                                             * (1 + np.asarray(inf_annual_post, dtype=float)) ** years_to_retirement
+                                             * (1 + np.asarray(tax_rate, dtype=float)))
+        pv_pension_growing_annuity = annual_needed_at_retirement_gross * growing_annuity_factor(
+            market_rate_post_retirement, growth_post_retirement, count_down_years)
+        pv_pension_most_recent_birthday = pv_pension_growing_annuity / (1 + np.asarray(market_rate_pre_retirement, dtype=float)) ** (years_to_retirement - 1)
+        deposit = (pv_pension_most_recent_birthday - initial_amount_for_pension) / growing_annuity_factor(
+            market_rate_pre_retirement, growth_pre_retirement, years_to_retirement)
+        overfunded = deposit < 0
+        deposit = np.maximum(deposit, 0.0)
+
+    valid = (years_to_retirement >= 2) & (count_down_years >= 1)
+    pv_pension_growing_annuity = np.where(valid, pv_pension_growing_annuity, np.nan)
+    pv_pension_most_recent_birthday = np.where(valid, pv_pension_most_recent_birthday, np.nan)
+    deposit = np.where(valid, deposit, np.nan)
+    overfunded &= valid
+
+    return Batch(age, years_to_retirement, count_down_years, annual_needed_at_retirement_gross,
+                 pv_pension_growing_annuity, pv_pension_most_recent_birthday, deposit, deposit / 12, overfunded)
+
+
+def schedules(result, initial_amount_for_pension, growth_pre_retirement, growth_post_retirement,
+              market_rate_pre_retirement, market_rate_post_retirement):
+    """Year-by-year whole-life schedules of an :func:`evaluate` result, in long format.
+
+    Rows follow the engine's ``pension_plan``: the current balance, the planned
+    deposits up to retirement and the withdrawals after it, with the balance
+    carried forward as is. Over-funded rows make no deposits and NaN rows are
+    skipped. Returns a dict of equally long arrays: ``row`` (position in the
+    input), ``year`` (int16 offset from the most recent birthday), ``age``
+    (int16), ``deposit``, ``withdrawal`` and ``balance``.
+    """
+    valid = np.flatnonzero(np.isfinite(result.initial_annual_deposit_amount))
+    columns = ('row', 'year', 'age', 'deposit', 'withdrawal', 'balance')
+    if not valid.size:
+        return {name: np.empty(0) for name in columns}
+
+    def pick(values):
+        return np.broadcast_to(values, result.age.shape)[valid][:, np.newaxis]
+
+    ytr, cdy = pick(result.years_to_retirement), pick(result.count_down_years)
+    start, first_withdrawal = pick(initial_amount_for_pension), pick(result.annual_needed_at_retirement_gross)
+    first_deposit = pick(result.initial_annual_deposit_amount)
+    years = np.arange(1, (ytr + cdy).max())
+    rates = np.where(years < ytr, pick(market_rate_pre_retirement), pick(market_rate_post_retirement))
+    growth = np.where(years == 1, 0.0, np.where(years < ytr, pick(growth_pre_retirement), pick(growth_post_retirement)))
+
+    deposits, withdrawals = solver.cash_flow_factors(growth, ytr[:, 0])
+    deposits, withdrawals = first_deposit * deposits, first_withdrawal * withdrawals
+    balance = engine.compound(start[:, 0], 1 + rates, deposits - withdrawals)
+
+    year = np.arange(years.size + 1, dtype=np.int16)
+    mask = year < ytr + cdy
+    return {
+        'row': np.broadcast_to(valid[:, np.newaxis], mask.shape)[mask],
+        'year': np.broadcast_to(year, mask.shape)[mask],
+        'age': (pick(result.age).astype(np.int16) + year)[mask],
+        'deposit': np.concatenate((np.zeros_like(start), deposits), axis=1)[mask],
+        'withdrawal': np.concatenate((np.zeros_like(start), withdrawals), axis=1)[mask],
+        'balance': np.concatenate((np.broadcast_to(start, first_deposit.shape), balance), axis=1)[mask],
+    }
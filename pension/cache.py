@@ -0,0 +1,138 @@
+"""Memoized versions of the engine entry points.
+
+Streamlit reruns the whole script on every interaction, but imported modules
+survive reruns and are shared by every session of the server process. The
+caches here therefore turn a repeated scenario into a dictionary lookup.
+
+Keys are normalized scenarios (dates as ordinals, numbers as floats), so
+``date`` vs ``datetime`` or ``int`` vs ``numpy.float64`` inputs share an
+entry. Cached projections are shared objects: treat them as read-only.
+``schedules`` keeps compact ``engine.Schedules``, a few times smaller than
+the DataFrames of ``project``, so more scenarios fit in the same cache.
+
+``simulate`` takes its options as keywords only. Pass a ``seed``: a cached
+unseeded simulation would keep returning its first draw.
+"""
+from collections import OrderedDict
+from datetime import date
+from typing import NamedTuple
+import functools
+import threading
+import time
+
+import numpy as np
+
+from pension import engine, metrics, montecarlo
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+    ttl: float
+
+
+class LRUCache:
+    """A thread-safe least-recently-used cache whose entries expire after ``ttl`` seconds.
+
+    ``maxsize`` and ``ttl`` are plain attributes and may be changed at any time;
+    ``ttl=None`` keeps entries until they are evicted.
+    """
+
+    def __init__(self, maxsize=128, ttl=None, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (self.ttl is None or self.clock() - entry[0] < self.ttl):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (self.clock(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._entries), self.ttl)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+
+_MISSING = object()
+
+
+def memoize(key, maxsize=128, ttl=None):
+    """Cache a function in an LRUCache, keyed on ``key(*args, **kwargs)``.
+
+    Like ``functools.lru_cache``, the wrapper has ``cache_info()`` and
+    ``cache_clear()``, plus the underlying ``cache``. While metrics are enabled,
+    lookups are counted as ``cache.<name>.hits`` and ``cache.<name>.misses``.
+    """
+    def decorator(func):
+        cache = LRUCache(maxsize, ttl)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            k = key(*args, **kwargs)
+            value = cache.get(k, _MISSING)
+            if value is _MISSING:
+                metrics.count(f'cache.{func.__name__}.misses')
+                value = func(*args, **kwargs)
+                cache.put(k, value)
+            else:
+                metrics.count(f'cache.{func.__name__}.hits')
+            return value
+
+        wrapper.cache = cache
+        wrapper.cache_info = cache.info
+        wrapper.cache_clear = cache.clear
+        return wrapper
+    return decorator
+
+
+def _normalize(value):
+    if isinstance(value, date):
+        return value.toordinal()
+    if isinstance(value, np.ndarray):
+        return value.shape, value.tobytes()
+    if isinstance(value, (list, tuple)):
+        return tuple(_normalize(v) for v in value)
+    if isinstance(value, (int, float, np.number)):
+        return float(value)
+    return value
+
+
+@metrics.timed('normalize')
+def scenario_key(s):
+    """A hashable key for a Scenario: dates as ordinals, numbers as floats."""
+    return tuple(_normalize(v) for v in s)
+
+
+def _options_key(s, **options):
+    return scenario_key(s), tuple(sorted((name, _normalize(v)) for name, v in options.items()))
+
+
+project = memoize(scenario_key, maxsize=256, ttl=3600)(engine.project)
+schedules = memoize(scenario_key, maxsize=256, ttl=3600)(engine.schedules)
+simulate = memoize(_options_key, maxsize=32, ttl=3600)(montecarlo.simulate)
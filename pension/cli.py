@@ -0,0 +1,127 @@
+"""Command-line batch runs: ``python -m pension clients.csv deposits.parquet``.
+
+Scenarios are read in chunks from CSV or Parquet (by file extension), evaluated
+with :mod:`pension.batch` and written back chunk by chunk, one Parquet row group
+per chunk, so memory stays flat however long the input is. Neither Streamlit
+nor Plotly is imported. Parquet needs ``pyarrow``.
+
+The input needs one column per scenario field, with rates as fractions::
+
+    birth_date, monthly_cost_now_net, initial_amount_for_pension, retirement_age,
+    life_expectancy, inf_annual_post, growth_pre_retirement, growth_post_retirement,
+    tax_rate, market_rate_pre_retirement, market_rate_post_retirement
+
+Other columns are copied to the output unchanged. The results are appended as
+the fields of :class:`pension.batch.Batch`; a client whose initial amount already
+covers the pension gets a deposit of 0 and ``overfunded`` set.
+"""
+from datetime import date
+import argparse
+
+import pandas as pd
+
+from pension import batch
+
+COLUMNS = ('birth_date', 'monthly_cost_now_net', 'initial_amount_for_pension', 'retirement_age',
+           'life_expectancy', 'inf_annual_post', 'growth_pre_retirement', 'growth_post_retirement',
+           'tax_rate', 'market_rate_pre_retirement', 'market_rate_post_retirement')
+
+
+def _is_parquet(path):
+    return str(path).endswith(('.parquet', '.pq'))
+
+
+def read_chunks(path, chunk_size):
+    """Yield DataFrames of at most ``chunk_size`` rows from a CSV or Parquet file."""
+    if _is_parquet(path):
+        import pyarrow.parquet as pq
+        for record_batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield record_batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+
+class ChunkWriter:
+    """Append DataFrames to a CSV file, or as row groups to a Parquet file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._parquet = _is_parquet(path)
+        self._writer = None
+        self._started = False
+
+    def write(self, frame):
+        if self._parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            self._writer.write_table(table.cast(self._writer.schema))
+        else:
+            frame.to_csv(self.path, mode='a' if self._started else 'w', header=not self._started, index=False)
+        self._started = True
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def evaluate_chunk(chunk, today_date=None):
+    """Batch results for a DataFrame of scenarios, as ``(result, arguments)``."""
+    missing = [c for c in COLUMNS if c not in chunk.columns]
+    if missing:
+        raise ValueError(f"missing input columns: {', '.join(missing)}")
+    arguments = {c: chunk[c].to_numpy() for c in COLUMNS}
+    arguments['birth_date'] = pd.to_datetime(chunk['birth_date']).to_numpy().astype('datetime64[D]')
+    return batch.evaluate(**arguments, today_date=today_date), arguments
+
+
+def run(input_path, output_path, schedules_path=None, chunk_size=10_000, today_date=None):
+    """Evaluate every scenario in ``input_path``; returns the number of rows processed.
+
+    ``output_path`` gets the input columns plus the batch results.
+    ``schedules_path``, if given, gets the year-by-year schedules, keyed by
+    ``row`` (the scenario's position in the input).
+    """
+    if today_date is None:
+        today_date = date.today()
+    rows = 0
+    schedules = ChunkWriter(schedules_path) if schedules_path is not None else None
+    try:
+        with ChunkWriter(output_path) as output:
+            for chunk in read_chunks(input_path, chunk_size):
+                result, arguments = evaluate_chunk(chunk, today_date)
+                output.write(chunk.reset_index(drop=True).assign(**result._asdict()))
+                if schedules is not None:
+                    columns = batch.schedules(result, arguments['initial_amount_for_pension'],
+                                              arguments['growth_pre_retirement'], arguments['growth_post_retirement'],
+                                              arguments['market_rate_pre_retirement'], arguments['market_rate_post_retirement'])
+                    columns['row'] = columns['row'] + rows
+                    schedules.write(pd.DataFrame(columns))
+                rows += len(chunk)
+    finally:
+        if schedules is not None:
+            schedules.close()
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m pension', description="Compute required pension deposits for many clients.")
+    parser.add_argument('input', help="CSV or Parquet file of scenarios")
+    parser.add_argument('output', help="CSV or Parquet file for the results")
+    parser.add_argument('--schedules', metavar='PATH', help="also write year-by-year schedules to this CSV or Parquet file")
+    parser.add_argument('--chunk-size', type=int, default=10_000, help="scenarios per chunk (default: %(default)s)")
+    parser.add_argument('--today', type=date.fromisoformat, help="evaluate as of this date (YYYY-MM-DD) instead of today")
+    args = parser.parse_args(argv)
+    try:
+        rows = run(args.input, args.output, args.schedules, args.chunk_size, args.today)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"{rows:,} scenarios written to {args.output}")
@@ -0,0 +1,360 @@
+"""Projection engine behind the pension calculator.
+
+The year-by-year balances are linear recurrences ``b[i] = b[i-1] * r[i] + f[i]``,
+so instead of walking a date index we evaluate them in closed form with NumPy
+cumulative products and discounted cumulative sums.
+
+Schedules can also be projected per period (e.g. monthly). The annual rates are
+converted to effective per-period rates. Each year's deposit is spread over the
+periods of the year it closes, and each year's withdrawal over the periods
+starting at its date. Both are sized to keep the same value, so the required
+deposit and the balances up to retirement are those of the annual plan, and
+the plan still runs down to a zero terminal balance. A non-zero terminal
+balance would differ, since the withdrawals fall at other times within the
+year. After retirement a balance is shown after its period's withdrawal, so on
+each anniversary it still holds the rest of that year's withdrawals and
+exceeds the annual balance by their present value.
+
+pandas is only imported once dates or DataFrames are asked for.
+"""
+from datetime import datetime, date
+from typing import TYPE_CHECKING, NamedTuple
+
+import numpy as np
+from dateutil.relativedelta import relativedelta
+
+from pension import metrics
+from pension.annuity import growing_annuity_factor
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+class Scenario(NamedTuple):
+    """Calculator inputs. Rates are fractions (0.038), not percentages."""
+    birth_date: date
+    monthly_cost_now_net: float
+    initial_amount_for_pension: float
+    retirement_age: int
+    life_expectancy: int
+    inf_annual_post: float
+    growth_pre_retirement: float
+    growth_post_retirement: float
+    tax_rate: float
+    market_rate_pre_retirement: float
+    market_rate_post_retirement: float
+    today_date: date
+    periods_per_year: int = 1
+
+
+class Plan(NamedTuple):
+    """Scalar figures derived from a Scenario."""
+    age: int
+    most_recent_birthday: date
+    retirement_date: date
+    terminal_date: date
+    years_to_retirement: int
+    count_down_years: int
+    annual_cost_now_net: float
+    monthly_needed_at_retirement_net: float
+    annual_needed_at_retirement_net: float
+    annual_needed_at_retirement_gross: float
+    pv_pension_growing_annuity: float
+    pv_pension_most_recent_birthday: float
+    initial_annual_deposit_amount: float
+    deposit_per_period: float
+    withdrawal_per_period: float
+
+
+class Projection(NamedTuple):
+    plan: Plan
+    pension_plan: 'pd.DataFrame'
+    pension_balance: 'pd.DataFrame'
+    pre_pension_balance: 'pd.DataFrame'
+
+
+def scenario(birth_date, monthly_cost_now_net, initial_amount_for_pension, retirement_age, life_expectancy,
+             inf_annual_post, growth_pre_retirement, growth_post_retirement, tax_rate,
+             market_rate_pre_retirement, market_rate_post_retirement, today_date=None, periods_per_year=1):
+    """Build a Scenario, defaulting ``today_date`` to today."""
+    if today_date is None:
+        today_date = datetime.now().date()
+    return Scenario(birth_date, monthly_cost_now_net, initial_amount_for_pension, retirement_age, life_expectancy,
+                    inf_annual_post, growth_pre_retirement, growth_post_retirement, tax_rate,
+                    market_rate_pre_retirement, market_rate_post_retirement, today_date, periods_per_year)
+
+
+def compound(start, rates, flows):
+    """Balances of ``b[i] = b[i-1] * rates[i] + flows[i]`` with ``b[-1] = start``.
+
+    Works along the last axis, so ``start`` may carry leading (batch) dimensions.
+    """
+    growth = np.cumprod(rates, axis=-1)
+    return growth * (np.asarray(start, dtype=float)[..., np.newaxis] + np.cumsum(flows / growth, axis=-1))
+
+
+def _compound_abs(start, rates, flows):
+    """Like compound(), but each step carries ``abs(b[i-1])`` forward.
+
+    That is what the original cash-flow loop did; the recurrence is restarted
+    after every negative balance, which in practice happens at most a few times.
+    """
+    balance = compound(abs(start), rates, flows)
+    negative = np.flatnonzero(balance[:-1] < 0)
+    while negative.size:
+        k = negative[0] + 1
+        balance[k:] = compound(abs(balance[k - 1]), rates[k:], flows[k:])
+        negative = k + np.flatnonzero(balance[k:-1] < 0)
+    return balance
+
+
+def period_rates(rate, periods_per_year):
+    """Per-period view of annual gross rates (``1 + r``).
+
+    Returns the effective per-period gross rate, the share of an annual deposit
+    paid at the end of each period (worth the annual deposit at year end) and
+    the share of an annual withdrawal paid at the start of each period (worth
+    the annual withdrawal at year start).
+    """
+    rate = np.asarray(rate, dtype=float)
+    if periods_per_year == 1:
+        return rate, np.ones_like(rate), np.ones_like(rate)
+    period = rate ** (1 / periods_per_year)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        deposit = np.where(rate == 1, 1 / periods_per_year, (period - 1) / (rate - 1))
+        withdrawal = np.where(rate == 1, 1 / periods_per_year, (1 - 1 / period) / (1 - 1 / rate))
+    return period, deposit, withdrawal
+
+
+def anniversaries(year, month, day, periods, periods_per_year=1):
+    """``periods`` dates ``12 / periods_per_year`` months apart starting at ``year-month-day``.
+
+    Days past the end of a month (e.g. the 31st, or 29 February) fall on its last day.
+    """
+    months = np.datetime64(year - 1970, 'Y').astype('datetime64[M]') + (month - 1) + np.arange(periods) * (12 // periods_per_year)
+    starts = months.astype('datetime64[D]')
+    lengths = ((months + 1).astype('datetime64[D]') - starts).astype(np.int64)
+    import pandas as pd
+    return pd.DatetimeIndex(starts + (np.minimum(day, lengths) - 1))
+
+
+def _ages(age, periods, periods_per_year):
+    offset = np.arange(periods)
+    return age + (offset if periods_per_year == 1 else offset / periods_per_year)
+
+
+@metrics.timed('summarize')
+def summarize(s):
+    """Compute the scalar Plan for a Scenario."""
+    today_date = s.today_date
+    birth_date = s.birth_date
+    age = today_date.year - birth_date.year - ((today_date.month, today_date.day) < (birth_date.month, birth_date.day))
+    this_year_birthday = today_date.replace(month=birth_date.month, day=birth_date.day)
+    most_recent_birthday = this_year_birthday - relativedelta(years=1) if today_date < this_year_birthday else this_year_birthday
+
+    retirement_date = birth_date + relativedelta(years=s.retirement_age)
+    years_to_retirement = retirement_date.year - most_recent_birthday.year
+
+    terminal_date = birth_date + relativedelta(years=s.life_expectancy)
+    count_down_years = terminal_date.year - retirement_date.year
+
+    if years_to_retirement < 2:
+        raise ValueError("retirement must be at least two years away")
+    if count_down_years < 1:
+        raise ValueError("terminal year must be after the retirement year")
+    if s.periods_per_year < 1 or 12 % s.periods_per_year:
+        raise ValueError("periods per year must divide 12")
+
+    annual_cost_now_net = 12 * s.monthly_cost_now_net
+    monthly_needed_at_retirement_net = s.monthly_cost_now_net * (1+s.inf_annual_post)**years_to_retirement
+    annual_needed_at_retirement_net = monthly_needed_at_retirement_net * 12
+    annual_needed_at_retirement_gross = annual_needed_at_retirement_net * (1 + s.tax_rate)
+
+    pv_pension_growing_annuity = float(growing_annuity_factor(s.market_rate_post_retirement, s.growth_post_retirement, count_down_years)) * annual_needed_at_retirement_gross
+    pv_pension_most_recent_birthday = pv_pension_growing_annuity / (1+s.market_rate_pre_retirement)**(years_to_retirement-1)
+    initial_annual_deposit_amount = (pv_pension_most_recent_birthday - s.initial_amount_for_pension) / float(growing_annuity_factor(s.market_rate_pre_retirement, s.growth_pre_retirement, years_to_retirement))
+    initial_annual_deposit_amount = initial_annual_deposit_amount if initial_annual_deposit_amount >= 0 else -1
+
+    _, deposit_share, _ = period_rates(1 + s.market_rate_pre_retirement, s.periods_per_year)
+    _, _, withdrawal_share = period_rates(1 + s.market_rate_post_retirement, s.periods_per_year)
+    deposit_per_period = initial_annual_deposit_amount * float(deposit_share) if initial_annual_deposit_amount >= 0 else -1
+    withdrawal_per_period = annual_needed_at_retirement_gross * float(withdrawal_share)
+
+    return Plan(age, most_recent_birthday, retirement_date, terminal_date, years_to_retirement, count_down_years,
+                annual_cost_now_net, monthly_needed_at_retirement_net, annual_needed_at_retirement_net,
+                annual_needed_at_retirement_gross, pv_pension_growing_annuity, pv_pension_most_recent_birthday,
+                initial_annual_deposit_amount, deposit_per_period, withdrawal_per_period)
+
+
+class Schedule:
+    """A projected schedule, kept as a few contiguous arrays.
+
+    Period ``k`` falls ``k`` periods after the ``start`` anniversary, a
+    ``(year, month, day)`` tuple, and its cash flow belongs to year ``year[k]``
+    (int16 offsets): a deposit to the year it closes, a withdrawal to the year
+    it opens. Each column is one of three things. A float64 array as long as
+    the schedule has one value per period. A shorter float64 array has one
+    value per year, looked up through ``year``. A plain float is constant.
+    ``Age`` is derived from ``age`` and not stored; ``names`` lists every
+    column, ``Age`` included, in order. Dates, expanded columns and a DataFrame
+    are built on demand, and columns can be read as attributes, as on a
+    DataFrame.
+    """
+    __slots__ = ('start', 'age', 'periods_per_year', 'year', 'columns', 'names')
+
+    def __init__(self, start, age, periods_per_year, year, columns, names):
+        self.start = start
+        self.age = age
+        self.periods_per_year = periods_per_year
+        self.year = np.asarray(year, dtype=np.int16)
+        self.columns = columns
+        self.names = names
+
+    def __len__(self):
+        return self.year.size
+
+    def __getattr__(self, name):
+        # only reached for names that are not slots, e.g. self.Balance
+        if name in self.__slots__ or name not in self.names:
+            raise AttributeError(name)
+        return self.column(name)
+
+    def column(self, name):
+        """Column ``name`` with one value per period."""
+        if name == 'Age':
+            return _ages(self.age, len(self), self.periods_per_year)
+        values = self.columns[name]
+        if np.ndim(values) == 0:
+            return np.full(len(self), values)
+        return values if values.size == len(self) else values[self.year]
+
+    def dates(self):
+        return anniversaries(*self.start, len(self), self.periods_per_year)
+
+    @property
+    def nbytes(self):
+        return self.year.nbytes + sum(np.asarray(v).nbytes for v in self.columns.values())
+
+    def to_frame(self):
+        """The schedule as a DataFrame indexed by date."""
+        import pandas as pd
+        return pd.DataFrame({name: self.column(name) for name in self.names}, index=self.dates())
+
+
+class Schedules(NamedTuple):
+    plan: Plan
+    pension_plan: Schedule
+    pension_balance: Schedule
+    pre_pension_balance: Schedule
+
+
+@metrics.timed('project.pension_plan')
+def schedule_pension_plan(s, p):
+    """Whole-life cash flows and balance, from the most recent birthday to the terminal year.
+
+    Row 0 is the current balance, rows ``1..years_to_retirement-1`` the growing
+    deposits, the retirement row nets the last deposit against the first
+    withdrawal, and the remaining rows the growing withdrawals.
+    """
+    m = s.periods_per_year
+    ytr, cdy = p.years_to_retirement, p.count_down_years
+    n = ytr + cdy
+    gross = p.annual_needed_at_retirement_gross
+    growth = np.concatenate(([0, 1], np.full(ytr - 2, 1 + s.growth_pre_retirement), np.full(cdy, 1 + s.growth_post_retirement)))
+    rate = np.concatenate((np.full(ytr, 1 + s.market_rate_pre_retirement), np.full(cdy, 1 + s.market_rate_post_retirement)))
+
+    deposits = -p.initial_annual_deposit_amount * np.cumprod(growth[1:ytr])
+    deposits = np.append(deposits, deposits[-1] * growth[ytr])
+    withdrawals = gross * np.cumprod(np.concatenate(([1], growth[ytr + 1:])))
+
+    # period k > 0 belongs to the year of the deposit it closes or of the withdrawal
+    # it opens; either way that year's rate is the one it compounds at
+    k = np.arange(1, n * m)
+    year = np.where(k <= ytr * m, -(-k // m), k // m)
+    period_rate, deposit_share, withdrawal_share = period_rates(rate, m)
+    period_deposits = np.zeros(n * m - 1)
+    period_deposits[:ytr * m] = np.repeat(deposits * deposit_share[1:ytr + 1], m)
+    period_withdrawals = np.zeros(n * m - 1)
+    period_withdrawals[ytr * m - 1:] = np.repeat(withdrawals * withdrawal_share[ytr:], m)
+
+    cf = np.concatenate(([-s.initial_amount_for_pension], period_withdrawals + period_deposits))
+    flows = np.abs(period_deposits) - period_withdrawals
+    balance = np.concatenate(([s.initial_amount_for_pension], _compound_abs(s.initial_amount_for_pension, period_rate[year], flows)))
+
+    start = p.most_recent_birthday
+    return Schedule((start.year, start.month, start.day), p.age, m, np.concatenate(([0], year)), {
+        'Growth': growth,
+        'Rate': period_rate,
+        'Balance': balance,
+        'CF': cf,
+    }, ('Age', 'Growth', 'Rate', 'Balance', 'CF'))
+
+
+@metrics.timed('project.pension_balance')
+def schedule_pension_balance(s, p):
+    """Withdrawals and remaining balance for every period in retirement."""
+    m = s.periods_per_year
+    n = p.count_down_years * m
+    rate = s.market_rate_post_retirement
+    period_rate, _, withdrawal_share = period_rates(1 + rate, m)
+    year = np.arange(n) // m
+    factor = (1 + s.growth_post_retirement) ** np.arange(p.count_down_years)
+    outflow = float(p.annual_needed_at_retirement_gross * withdrawal_share)
+    # the present value sits a whole year before the first withdrawal
+    rates = np.full(n, period_rate)
+    rates[0] = 1 + rate
+    return Schedule((p.retirement_date.year, p.retirement_date.month, p.retirement_date.day), p.age + p.years_to_retirement, m, year, {
+        'Outflow': outflow,
+        'InflationFactor': factor,
+        'InflatedOutflow': factor * outflow,
+        'Rate': rate,
+        'Balance': compound(p.pv_pension_growing_annuity, rates, -factor[year] * outflow),
+    }, ('Outflow', 'Age', 'InflationFactor', 'InflatedOutflow', 'Rate', 'Balance'))
+
+
+@metrics.timed('project.pre_pension_balance')
+def schedule_pre_pension_balance(s, p):
+    """Deposits and accumulated balance from the most recent birthday up to retirement."""
+    m = s.periods_per_year
+    n = p.years_to_retirement * m
+    rate, deposit_share, _ = period_rates(1 + s.market_rate_pre_retirement, m)
+    depositions = np.concatenate(([-s.initial_amount_for_pension],
+                                  -p.initial_annual_deposit_amount * deposit_share * (1 + s.growth_pre_retirement) ** (np.arange(n) // m)))
+    balance = np.concatenate(([s.initial_amount_for_pension],
+                              compound(s.initial_amount_for_pension, np.full(n, rate), -depositions[1:])))
+    return Schedule((p.most_recent_birthday.year, p.retirement_date.month, p.retirement_date.day), p.age, m, -(-np.arange(n + 1) // m), {
+        'Depositions': depositions,
+        'Rate': float(rate),
+        'Balance': balance,
+    }, ('Depositions', 'Age', 'Rate', 'Balance'))
+
+
+def project_pension_plan(s, p):
+    """``schedule_pension_plan`` as a DataFrame indexed by ``date`` objects."""
+    frame = schedule_pension_plan(s, p).to_frame()
+    frame.index = frame.index.date
+    return frame
+
+
+def project_pension_balance(s, p):
+    """``schedule_pension_balance`` as a DataFrame."""
+    return schedule_pension_balance(s, p).to_frame()
+
+
+def project_pre_pension_balance(s, p):
+    """``schedule_pre_pension_balance`` as a DataFrame."""
+    return schedule_pre_pension_balance(s, p).to_frame()
+
+
+def schedules(s):
+    """Summarize a Scenario and build all three schedules, as compact Schedules."""
+    p = summarize(s)
+    return Schedules(p, schedule_pension_plan(s, p), schedule_pension_balance(s, p), schedule_pre_pension_balance(s, p))
+
+
+def project(s):
+    """Summarize a Scenario and build all three schedules, as DataFrames."""
+    p, pension_plan, pension_balance, pre_pension_balance = schedules(s)
+    frame = pension_plan.to_frame()
+    frame.index = frame.index.date
+    return Projection(p, frame, pension_balance.to_frame(), pre_pension_balance.to_frame())
@@ -0,0 +1,247 @@
+"""Opt-in timing of the calculator's stages.
+
+Instrumentation is off by default. ``enable()``, or ``PENSION_METRICS=1`` in the
+environment, turns it on. While it is off, ``stage()`` returns a shared no-op
+context manager and functions wrapped with ``timed()`` pay one flag check
+(well under a microsecond). While it is on, each stage costs a few tens of
+microseconds, mostly counting the allocated blocks.
+
+Each stage records its wall time and the net number of memory blocks Python
+allocated during it (``sys.getallocatedblocks``). With ``PENSION_METRICS=memory``
+or ``enable(trace_memory=True)``, tracemalloc runs too and the stage's peak
+bytes are recorded. That includes NumPy buffers, but slows everything down.
+Both memory figures are process-wide, so they are only kept for stages that
+overlapped no stage of another thread (e.g. another session's rerun); for the
+others they are left as None.
+
+Samples are added to the process-wide totals (see ``prometheus()``) and to the
+calling thread's current run, if ``start_run()`` was called (the app starts one
+per rerun). A net block count can be negative, so the totals keep only each
+stage's latest one, exported as a gauge. Samples are also logged as JSON lines
+on the ``pension.metrics`` logger, at DEBUG level.
+"""
+from contextlib import nullcontext
+from typing import NamedTuple
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+_enabled = False
+_lock = threading.Lock()
+_local = threading.local()
+_totals = {}
+_counters = {}
+_server = None
+_open = 0  # threads with a stage open
+_opened = 0  # outermost stages opened so far, to notice overlapping threads
+_tracing = False  # whether enable() started tracemalloc, and disable() should stop it
+_NULL = nullcontext()
+
+
+class Sample(NamedTuple):
+    stage: str
+    seconds: float
+    blocks: int
+    peak_bytes: int
+
+
+class Run:
+    """The samples and counters recorded by one thread since ``start_run()``."""
+
+    def __init__(self):
+        self.samples = []
+        self.counters = {}
+
+
+def enable(trace_memory=False):
+    """Start recording; ``trace_memory`` also starts tracemalloc for peak bytes."""
+    global _enabled, _tracing
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _tracing = True
+    _enabled = True
+
+
+def disable():
+    """Stop recording, and stop tracemalloc if ``enable()`` started it."""
+    global _enabled, _tracing
+    _enabled = False
+    if _tracing:
+        tracemalloc.stop()
+        _tracing = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    """Forget the process-wide totals and counters."""
+    with _lock:
+        _totals.clear()
+        _counters.clear()
+
+
+def start_run():
+    """Collect this thread's samples and counters into a new Run, and return it."""
+    run = _local.run = Run()
+    return run
+
+
+def current_run():
+    return getattr(_local, 'run', None)
+
+
+def _record(sample):
+    with _lock:
+        total = _totals.setdefault(sample.stage, [0, 0.0, None])
+        total[0] += 1
+        total[1] += sample.seconds
+        if sample.blocks is not None:
+            total[2] = sample.blocks
+    run = current_run()
+    if run is not None:
+        run.samples.append(sample)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(json.dumps(sample._asdict()))
+
+
+class _Stage:
+    __slots__ = ('name', 'start', 'blocks', 'traced', 'high', 'alone', 'opened')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        global _open, _opened
+        depth = _local.__dict__.get('depth', 0)
+        with _lock:
+            if not depth:
+                _open += 1
+                _opened += 1
+            self.alone, self.opened = _open == 1, _opened
+        _local.depth = depth + 1
+        self.traced = None
+        if tracemalloc.is_tracing():
+            # resetting the peak would lose the enclosing stage's, so hand it up first
+            self.traced, peak = tracemalloc.get_traced_memory()
+            stack = _local.__dict__.setdefault('stack', [])
+            if stack:
+                stack[-1].high = max(stack[-1].high, peak)
+            stack.append(self)
+            self.high = 0
+            tracemalloc.reset_peak()
+        self.blocks = sys.getallocatedblocks()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        global _open
+        seconds = time.perf_counter() - self.start
+        blocks = sys.getallocatedblocks() - self.blocks
+        peak = None
+        if self.traced is not None:
+            high = max(self.high, tracemalloc.get_traced_memory()[1])
+            peak = high - self.traced
+            stack = _local.stack
+            stack.pop()
+            if stack:
+                stack[-1].high = max(stack[-1].high, high)
+        _local.depth -= 1
+        with _lock:
+            # another thread's stage was open at the start or opened since
+            alone = self.alone and self.opened == _opened
+            if not _local.depth:
+                _open -= 1
+        if not alone:
+            blocks = peak = None
+        _record(Sample(self.name, seconds, blocks, peak))
+
+
+def stage(name):
+    """A context manager recording the enclosed code as stage ``name``."""
+    return _Stage(name) if _enabled else _NULL
+
+
+def timed(name):
+    """Decorator recording every call of a function as stage ``name``."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, value=1):
+    """Add ``value`` to counter ``name``, e.g. ``cache.project.hits``."""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+    run = current_run()
+    if run is not None:
+        run.counters[name] = run.counters.get(name, 0) + value
+
+
+def log_lines(run):
+    """A run's samples and counters as JSON lines."""
+    lines = [json.dumps(sample._asdict()) for sample in run.samples]
+    lines += [json.dumps({'counter': name, 'value': value}) for name, value in run.counters.items()]
+    return '\n'.join(lines) + '\n'
+
+
+def prometheus():
+    """The process-wide totals in the Prometheus text exposition format."""
+    with _lock:
+        totals = sorted(_totals.items())
+        counters = sorted(_counters.items())
+    lines = []
+    for metric, kind, index, help_text in (
+            ('pension_stage_calls_total', 'counter', 0, "Recorded calls of each stage."),
+            ('pension_stage_seconds_total', 'counter', 1, "Wall time spent in each stage."),
+            ('pension_stage_allocated_blocks', 'gauge', 2, "Net Python memory blocks allocated by the latest call of each stage.")):
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+        lines += [f'{metric}{{stage="{name}"}} {total[index]}' for name, total in totals if total[index] is not None]
+    for name, value in counters:
+        metric = 'pension_' + name.replace('.', '_') + '_total'
+        lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+    return '\n'.join(lines) + '\n'
+
+
+def serve(port, host='127.0.0.1'):
+    """Serve ``prometheus()`` over HTTP from a daemon thread, for a local scrape. Idempotent."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = prometheus().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    global _server
+    with _lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), Handler)
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server
+
+
+if os.environ.get('PENSION_METRICS'):
+    enable(trace_memory=os.environ['PENSION_METRICS'] == 'memory')
@@ -0,0 +1,173 @@
+"""Monte Carlo simulation of the whole-life balance with random returns and inflation.
+
+Each path follows the ``pension_plan`` schedule of the engine: the planned
+deposits until retirement, then withdrawals. Market returns replace the constant
+pre/post-retirement rates, and realised inflation replaces ``inf_annual_post``.
+The first withdrawal is indexed to the inflation realised before retirement.
+Later withdrawals keep their planned real growth: they grow by
+``growth_post_retirement`` plus the inflation surprise.
+
+Paths are simulated in chunks of ``(paths, years)`` arrays, so memory is
+bounded by the chunk size. The chunks can be spread over one process pool per
+process, sized to the machine's cores and started on first use, so only the
+first pooled simulation pays for starting the workers.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+import multiprocessing
+import os
+import threading
+
+import numpy as np
+
+from pension import engine, metrics
+
+MODELS = ('normal', 'lognormal', 'bootstrap')
+POOL_PATHS = 10_000  # from this many paths up, the app runs chunks on the pool
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class Simulation(NamedTuple):
+    age: np.ndarray
+    paths: int
+    success_probability: float
+    percentiles: tuple
+    bands: np.ndarray  # one row of Balance per percentile, one column per year
+
+
+class _Chunk(NamedTuple):
+    seed: np.random.SeedSequence
+    paths: int
+    model: str
+    params: dict
+    start: float
+    mean_returns: np.ndarray
+    deposits: np.ndarray
+    retirement_row: int
+    annual_cost_now_gross: float
+    inf_annual_post: float
+    growth_post_retirement: float
+    percentiles: tuple
+
+
+def load_history(path):
+    """Annual ``return`` and ``inflation`` columns (fractions) from a CSV file."""
+    import pandas as pd
+    history = pd.read_csv(path, usecols=['return', 'inflation'])
+    return history.to_numpy(dtype=float).T
+
+
+def _normal(rng, paths, mean_returns, inflation, volatility, inflation_volatility):
+    returns = rng.standard_normal((paths, mean_returns.size))
+    returns *= volatility
+    returns += mean_returns
+    return np.maximum(returns, -0.99, out=returns), _inflation(rng, returns.shape, inflation, inflation_volatility)
+
+
+def _inflation(rng, shape, inflation, inflation_volatility):
+    draws = rng.standard_normal(shape)
+    draws *= inflation_volatility
+    draws += inflation
+    return draws
+
+
+def _lognormal(rng, paths, mean_returns, inflation, volatility, inflation_volatility):
+    """Gross returns ``1 + r`` are lognormal with mean ``1 + mean_returns`` and std ``volatility``."""
+    sigma2 = np.log1p(volatility**2 / (1 + mean_returns)**2)
+    gross = rng.lognormal(np.log1p(mean_returns) - sigma2 / 2, np.sqrt(sigma2), (paths, mean_returns.size))
+    return gross - 1, _inflation(rng, gross.shape, inflation, inflation_volatility)
+
+
+def _bootstrap(rng, paths, mean_returns, inflation, history, block):
+    """Circular block bootstrap of (return, inflation) pairs, keeping their correlation."""
+    returns, inflations = history
+    years = mean_returns.size
+    blocks = -(-years // block)
+    starts = rng.integers(0, returns.size, (paths, blocks, 1))
+    index = ((starts + np.arange(block)) % returns.size).reshape(paths, -1)[:, :years]
+    return returns[index], inflations[index]
+
+
+def _executor():
+    """The shared process pool, started on first use.
+
+    Workers are spawned rather than forked: the app calls this from one of the
+    server's threads, and forking a threaded process can copy a held lock.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(os.cpu_count(), mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def _run_chunk(chunk):
+    rng = np.random.default_rng(chunk.seed)
+    draw = {'normal': _normal, 'lognormal': _lognormal, 'bootstrap': _bootstrap}[chunk.model]
+    returns, inflation = draw(rng, chunk.paths, chunk.mean_returns, chunk.inf_annual_post, **chunk.params)
+
+    r = chunk.retirement_row
+    first = chunk.annual_cost_now_gross * np.prod(1 + inflation[:, :r], axis=1)
+    growth = 1 + chunk.growth_post_retirement + inflation[:, r:] - chunk.inf_annual_post
+    growth = np.concatenate((np.ones((chunk.paths, 1)), growth), axis=1)
+    withdrawals = first[:, np.newaxis] * np.cumprod(growth, axis=1)
+
+    flows = np.broadcast_to(chunk.deposits, returns.shape).copy()
+    flows[:, r - 1:] -= withdrawals
+    balance = engine.compound(np.full(chunk.paths, chunk.start), 1 + returns, flows)
+    balance = np.concatenate((np.full((chunk.paths, 1), chunk.start), balance), axis=1)
+
+    succeeded = np.count_nonzero(np.all(balance >= -0.005, axis=1))
+    return succeeded, np.percentile(balance, chunk.percentiles, axis=0)
+
+
+@metrics.timed('simulate')
+def simulate(s, paths=10_000, model='normal', volatility=0.15, inflation_volatility=0.01,
+             history=None, block=5, percentiles=(5, 25, 50, 75, 95),
+             chunk_size=10_000, workers=1, seed=None):
+    """Simulate ``paths`` lifetimes of the Scenario's plan.
+
+    ``model`` is ``'normal'`` or ``'lognormal'`` (around the scenario's rates,
+    with the given volatilities) or ``'bootstrap'``, which resamples blocks of
+    ``block`` years from ``history`` as returned by :func:`load_history`.
+    ``workers`` > 1 runs the chunks on the shared process pool; None does so
+    only if the machine has more than one core.
+
+    Percentile bands are the path-weighted mean of the per-chunk percentiles,
+    which for chunks of thousands of paths is well within sampling noise of the
+    pooled percentile.
+    """
+    if model not in MODELS:
+        raise ValueError(f"model must be one of {MODELS}")
+    if model == 'bootstrap':
+        if history is None:
+            raise ValueError("the bootstrap model needs a history")
+        params = {'history': np.asarray(history, dtype=float), 'block': block}
+    else:
+        params = {'volatility': volatility, 'inflation_volatility': inflation_volatility}
+
+    p = engine.summarize(s)
+    ytr, cdy = p.years_to_retirement, p.count_down_years
+    mean_returns = np.concatenate((np.full(ytr - 1, s.market_rate_pre_retirement), np.full(cdy, s.market_rate_post_retirement)))
+    growth = np.concatenate(([1], np.full(ytr - 2, 1 + s.growth_pre_retirement), [1 + s.growth_post_retirement]))
+    deposits = np.concatenate((max(p.initial_annual_deposit_amount, 0) * np.cumprod(growth), np.zeros(cdy - 1)))
+
+    sizes = [min(chunk_size, paths - i) for i in range(0, paths, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    annual_cost_now_gross = 12 * s.monthly_cost_now_net * (1 + s.tax_rate)
+    chunks = [_Chunk(seed, size, model, params, s.initial_amount_for_pension, mean_returns, deposits, ytr,
+                     annual_cost_now_gross, s.inf_annual_post, s.growth_post_retirement, tuple(percentiles))
+              for seed, size in zip(seeds, sizes)]
+
+    workers = workers or os.cpu_count()
+    if workers > 1 and len(chunks) > 1:
+        results = list(_executor().map(_run_chunk, chunks))
+    else:
+        results = [_run_chunk(chunk) for chunk in chunks]
+
+    weights = np.array(sizes) / paths
+    bands = sum(w * bands for w, (_, bands) in zip(weights, results))
+    succeeded = sum(n for n, _ in results)
+    return Simulation(p.age + np.arange(ytr + cdy), paths, succeeded / paths, tuple(percentiles), bands)
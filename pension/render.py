@@ -0,0 +1,132 @@
+"""Plotly figures for the calculator.
+
+Building a figure with ``make_subplots`` and validating every property costs
+far more than the projection it shows. Each figure's layout and trace styles
+are therefore built once, kept as a template, and every rerun only injects
+its data arrays into a copy. The arrays are passed through as NumPy arrays
+(serialized as typed arrays, not lists), and long series are aggregated so a
+trace never carries more than ``max_points`` points. Plotly itself is only
+imported when the first figure is built.
+"""
+import copy
+import functools
+
+import numpy as np
+
+from pension import metrics
+
+MAX_POINTS = 500
+
+
+def aggregate(values, size, how):
+    """Collapse consecutive groups of ``size`` values into one: ``'sum'``, ``'first'`` or ``'last'``."""
+    values = np.asarray(values)
+    if size <= 1:
+        return values
+    starts = np.arange(0, values.size, size)
+    if how == 'sum':
+        return np.add.reduceat(values, starts)
+    if how == 'first':
+        return values[starts]
+    return values[np.minimum(starts + size - 1, values.size - 1)]
+
+
+def _bucket(points, max_points):
+    return -(-points // max_points)
+
+
+def _year_starts(year):
+    """The first row of each run of equal ``year`` values."""
+    year = np.asarray(year)
+    return np.flatnonzero(np.concatenate(([True], year[1:] != year[:-1])))
+
+
+def _figure(template, *traces):
+    """A Figure from a template's layout and trace styles, with the given data merged in.
+
+    The template was validated when it was built, so validation is skipped.
+    """
+    import plotly.graph_objects as go
+    data = [dict(style, **trace) for style, trace in zip(template['data'], traces)]
+    return go.Figure(data=data, layout=copy.deepcopy(template['layout']), _validate=False)
+
+
+@functools.lru_cache(maxsize=None)
+def _schedule_template(title, height):
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+    fig = make_subplots(rows=2, cols=1, subplot_titles=("CashFlows", "Account Balance"))
+    fig.add_trace(go.Bar(), row=1, col=1)
+    fig.add_trace(go.Bar(), row=2, col=1)
+    fig.update_layout(height=height, title_text=title, title_x=0.5 if not title else None, showlegend=False)
+    fig.update_xaxes(title_text="Age", tickmode='linear')
+    fig.update_yaxes(title_text="Amount", row=1, col=1)
+    fig.update_yaxes(title_text="Amount", row=2, col=1)
+    return fig.to_dict()
+
+
+@metrics.timed('figure.schedule')
+def schedule_figure(age, cash_flows, balance, title='', height=1000, year=None, periods_per_year=1, max_points=MAX_POINTS):
+    """Cash flows over the balance of a schedule, as two bar charts.
+
+    With ``year``, a schedule's year of each row, each year is drawn as one bar:
+    its cash flows are summed, and age and balance are taken on its anniversary
+    (every ``periods_per_year``-th row). Bars beyond ``max_points`` are merged.
+    """
+    if year is not None:
+        cash_flows = np.add.reduceat(cash_flows, _year_starts(year))
+        age, balance = age[::periods_per_year], balance[::periods_per_year]
+    size = _bucket(len(age), max_points)
+    age = aggregate(age, size, 'first')
+    return _figure(_schedule_template(title, height),
+                   {'x': age, 'y': aggregate(cash_flows, size, 'sum')},
+                   {'x': age, 'y': aggregate(balance, size, 'first')})
+
+
+@functools.lru_cache(maxsize=None)
+def _bands_template(title, height):
+    import plotly.graph_objects as go
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(line=dict(width=0), hoverinfo='skip'))
+    fig.add_trace(go.Scatter(line=dict(width=0), fill='tonexty', fillcolor='rgba(99,110,250,0.2)', name='5th - 95th percentile'))
+    fig.add_trace(go.Scatter(line=dict(width=0), hoverinfo='skip'))
+    fig.add_trace(go.Scatter(line=dict(width=0), fill='tonexty', fillcolor='rgba(99,110,250,0.4)', name='25th - 75th percentile'))
+    fig.add_trace(go.Scatter(line=dict(color='rgb(99,110,250)'), name='Median'))
+    fig.update_layout(height=height, title_text=title, showlegend=False)
+    fig.update_xaxes(title_text="Age", tickmode='linear')
+    fig.update_yaxes(title_text="Amount")
+    return fig.to_dict()
+
+
+@metrics.timed('figure.bands')
+def bands_figure(age, bands, title="Simulated Account Balance", height=600, max_points=MAX_POINTS):
+    """Fan chart of percentile bands, given as ``{percentile: values}`` with 5, 25, 50, 75 and 95."""
+    size = _bucket(len(age), max_points)
+    age = aggregate(age, size, 'first')
+    return _figure(_bands_template(title, height),
+                   *({'x': age, 'y': aggregate(bands[p], size, 'first')} for p in (95, 5, 75, 25, 50)))
+
+
+@functools.lru_cache(maxsize=None)
+def _heatmap_template(title, x_title, y_title, z_title, height):
+    import plotly.graph_objects as go
+    fig = go.Figure()
+    fig.add_trace(go.Heatmap(colorscale='RdYlGn', colorbar=dict(title=z_title),
+                             hovertemplate=f"{x_title}: %{{x}}<br>{y_title}: %{{y}}<br>{z_title}: %{{z:,.2f}}<extra></extra>"))
+    fig.add_trace(go.Scatter(mode='markers', marker=dict(symbol='x', size=12, color='black'), hoverinfo='skip'))
+    fig.update_layout(height=height, title_text=title, showlegend=False)
+    fig.update_xaxes(title_text=x_title, tickmode='linear')
+    fig.update_yaxes(title_text=y_title)
+    return fig.to_dict()
+
+
+@metrics.timed('figure.heatmap')
+def heatmap_figure(x, y, z, title='', x_title='', y_title='', z_title='', marker=None, reverse=False, zmid=None, height=600):
+    """Heatmap of ``z[y, x]``, with an optional ``(x, y)`` marker for the current choice.
+
+    The colours run red (low) to green (high), or the other way with
+    ``reverse``; ``zmid`` pins the middle colour to a value, e.g. 0.
+    """
+    return _figure(_heatmap_template(title, x_title, y_title, z_title, height),
+                   {'x': x, 'y': y, 'z': z, 'reversescale': reverse, 'zmid': zmid},
+                   {'x': [] if marker is None else [marker[0]], 'y': [] if marker is None else [marker[1]]})
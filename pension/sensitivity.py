@@ -0,0 +1,89 @@
+"""Required deposit and terminal balance over a grid of returns and retirement ages.
+
+The grid is one :func:`pension.batch.evaluate` call, broadcast over
+``(rates, retirement_ages)``. Its rows are cached per swept rate. Moving the
+scenario's own rate or retirement age, which are the grid's axes, therefore
+recomputes nothing. A changed rate range only evaluates the rows that are new.
+
+The terminal balance is what is left in the terminal year if the scenario's
+current annual deposit is kept: the surplus (or shortfall) against the
+required funding at the most recent birthday, carried forward at the plan's
+rates. It is affine in that deposit, so each cell keeps an intercept and a
+slope, and a new deposit only costs a multiply-add.
+"""
+from typing import NamedTuple
+
+import numpy as np
+
+from pension import batch, engine, metrics
+from pension.annuity import growing_annuity_factor
+from pension.cache import LRUCache, scenario_key
+
+RATES = np.round(np.arange(0.02, 0.12 + 1e-9, 0.005), 4)
+RETIREMENT_AGES = np.arange(55, 75)
+
+_rows = LRUCache(maxsize=4096, ttl=3600)
+
+
+class Surface(NamedTuple):
+    """Grid results, indexed ``[rate, retirement_age]``. Cells that the engine would reject are NaN."""
+    rates: np.ndarray
+    retirement_ages: np.ndarray
+    monthly_deposit: np.ndarray
+    terminal_balance: np.ndarray
+    annual_deposit: float
+
+
+def _arguments(s):
+    arguments = s._asdict()
+    del arguments['periods_per_year']
+    return arguments
+
+
+def _evaluate(s, rates, retirement_ages, field):
+    """``(deposit, intercept, slope)`` stacked on the last axis, for every ``(rate, retirement age)``."""
+    arguments = _arguments(s)
+    arguments[field] = rates[:, np.newaxis]
+    arguments['retirement_age'] = retirement_ages
+    result = batch.evaluate(**arguments)
+    rate_pre = np.asarray(arguments['market_rate_pre_retirement'], dtype=float)
+    rate_post = np.asarray(arguments['market_rate_post_retirement'], dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        carry = (1 + rate_pre) ** (result.years_to_retirement - 1) * (1 + rate_post) ** result.count_down_years
+        slope = growing_annuity_factor(rate_pre, s.growth_pre_retirement, result.years_to_retirement) * carry
+        intercept = (s.initial_amount_for_pension - result.pv_pension_most_recent_birthday) * carry
+    deposit = np.maximum(result.initial_annual_deposit_amount, 0)
+    return np.stack(np.broadcast_arrays(deposit, intercept, np.where(np.isfinite(deposit), slope, np.nan)), axis=-1)
+
+
+@metrics.timed('sensitivity')
+def surface(s, rates=RATES, retirement_ages=RETIREMENT_AGES, field='market_rate_pre_retirement'):
+    """Evaluate a Scenario over ``rates`` (for ``field``) × ``retirement_ages``.
+
+    ``monthly_deposit`` is the required deposit per month, and 0 where the
+    current balance already suffices. With yearly payments it is the annual
+    deposit over 12; otherwise each period's deposit spread over its months,
+    which with monthly payments is the plan's ``deposit_per_period``. ``terminal_balance`` is the balance left
+    in the terminal year if the scenario's own ``annual_deposit`` is kept.
+    """
+    rates = np.asarray(rates, dtype=float)
+    retirement_ages = np.asarray(retirement_ages)
+    # rows hold annual deposits, so they are shared by every payment frequency
+    base = (scenario_key(s._replace(**{field: 0.0, 'retirement_age': 0, 'periods_per_year': 1})), field, retirement_ages.tobytes())
+    rows = [_rows.get((base, rate)) for rate in rates.tolist()]
+    missing = [i for i, row in enumerate(rows) if row is None]
+    if missing:
+        for i, row in zip(missing, _evaluate(s, rates[missing], retirement_ages, field)):
+            _rows.put((base, float(rates[i])), row)
+            rows[i] = row
+    deposit, intercept, slope = np.moveaxis(np.stack(rows), -1, 0)
+    m = s.periods_per_year
+    if m == 1:
+        monthly_deposit = deposit / 12
+    else:
+        rate_pre = rates[:, np.newaxis] if field == 'market_rate_pre_retirement' else s.market_rate_pre_retirement
+        monthly_deposit = deposit * engine.period_rates(1 + rate_pre, m)[1] * (m / 12)
+
+    own = batch.evaluate(**_arguments(s)).initial_annual_deposit_amount
+    annual_deposit = float(np.maximum(own, 0)) if np.isfinite(own) else 0.0
+    return Surface(rates, retirement_ages, monthly_deposit, intercept + annual_deposit * slope, annual_deposit)
@@ -0,0 +1,82 @@
+"""Numeric solver for the required deposit under arbitrary per-year rates.
+
+The schedule is the engine's ``pension_plan`` without its first row. Year ``t``
+(``1..T``) compounds the balance at ``rates[t]``. Years ``1..retirement_row``
+receive a deposit and years ``retirement_row..T`` pay a withdrawal. Both cash
+flows grow by ``growth[t]``, and the first deposit and first withdrawal are not
+grown. The deposit is the amount that leaves a zero balance after year ``T``.
+
+Every argument broadcasts over leading axes, so many scenarios (sharing a
+horizon ``T``) are solved together. The terminal balance is affine in the
+deposit. Newton's method with its exact slope therefore lands on the root in
+one step. Further steps only polish floating-point error.
+"""
+import numpy as np
+
+from pension import engine, metrics
+
+
+def cash_flow_factors(growth, retirement_row):
+    """Relative deposit and withdrawal sizes for every year, as two ``(..., T)`` arrays."""
+    growth = np.asarray(growth, dtype=float)
+    retirement_row = np.asarray(retirement_row)[..., np.newaxis]
+    years = np.arange(1, growth.shape[-1] + 1)
+    factor = np.cumprod(1 + growth, axis=-1) / (1 + growth[..., :1])
+    at_retirement = np.take_along_axis(factor, np.broadcast_to(retirement_row - 1, factor.shape[:-1] + (1,)), axis=-1)
+    deposits = np.where(years <= retirement_row, factor, 0.0)
+    withdrawals = np.where(years >= retirement_row, factor / at_retirement, 0.0)
+    return deposits, withdrawals
+
+
+def terminal_balance(deposit, start, withdrawal, rates, growth, retirement_row):
+    """Balance after the last year for a first ``deposit`` and first ``withdrawal``."""
+    deposits, withdrawals = cash_flow_factors(growth, retirement_row)
+    flows = np.asarray(deposit, dtype=float)[..., np.newaxis] * deposits - np.asarray(withdrawal, dtype=float)[..., np.newaxis] * withdrawals
+    return engine.compound(start, 1 + np.asarray(rates, dtype=float), flows)[..., -1]
+
+
+@metrics.timed('solve')
+def required_deposit(start, withdrawal, rates, growth, retirement_row, tol=1e-9, maxiter=8):
+    """First annual deposit that leaves a zero terminal balance.
+
+    ``start`` is the current balance and ``withdrawal`` the first annual
+    withdrawal; ``rates`` and ``growth`` are ``(..., T)`` fractions. A negative
+    result means the plan is over-funded. Scenarios that never deposit
+    (``retirement_row < 1``) are NaN.
+    """
+    deposits, withdrawals = cash_flow_factors(growth, retirement_row)
+    rates = 1 + np.asarray(rates, dtype=float)
+    outflows = np.asarray(withdrawal, dtype=float)[..., np.newaxis] * withdrawals
+    slope = engine.compound(np.zeros(deposits.shape[:-1]), rates, deposits)[..., -1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        deposit = np.zeros(np.broadcast(slope, np.asarray(start), np.asarray(withdrawal)).shape)
+        for _ in range(maxiter):
+            residual = engine.compound(start, rates, deposit[..., np.newaxis] * deposits - outflows)[..., -1]
+            step = residual / slope
+            deposit = deposit - step
+            if np.all((np.abs(step) <= tol * (1 + np.abs(deposit))) | ~np.isfinite(step)):
+                break
+    return np.where(slope > 0, deposit, np.nan)
+
+
+def schedule(s, rates=None, growth=None):
+    """Per-year ``rates`` and ``growth`` of a Scenario, i.e. the engine's pension_plan rows ``1..``.
+
+    Either may be overridden with a vector of ``years_to_retirement +
+    count_down_years - 1`` values.
+    """
+    p = engine.summarize(s)
+    ytr, cdy = p.years_to_retirement, p.count_down_years
+    if rates is None:
+        rates = np.concatenate((np.full(ytr - 1, s.market_rate_pre_retirement), np.full(cdy, s.market_rate_post_retirement)))
+    if growth is None:
+        growth = np.concatenate(([0], np.full(ytr - 2, s.growth_pre_retirement), np.full(cdy, s.growth_post_retirement)))
+    return np.asarray(rates, dtype=float), np.asarray(growth, dtype=float)
+
+
+def solve(s, rates=None, growth=None):
+    """Required first annual deposit for a Scenario, optionally with per-year rate and growth vectors."""
+    p = engine.summarize(s)
+    rates, growth = schedule(s, rates, growth)
+    return float(required_deposit(s.initial_amount_for_pension, p.annual_needed_at_retirement_gross,
+                                  rates, growth, p.years_to_retirement))
@@ -1,24 +1,13 @@
 import streamlit as st
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-import numpy as np
-import pandas as pd
 from datetime import datetime
+import os
 from dateutil.relativedelta import relativedelta
-from tmval import Annuity, Rate
-import numpy_financial as npf
 
-def pmnt_growing_annuity(pv, rate, growth, periods):
-    assert rate!=growth, "rate must not equal growht!"
-    return pv/((1/(rate-growth))*(1- ((1+growth)/(1+rate))**periods))
+from pension import cache, engine, metrics, montecarlo, render, sensitivity
 
-def pv_growing_annuity(pmnt, rate, growth, periods):
-    assert rate!=growth, "rate must not equal growht!"
-    return pmnt * ((1/(rate-growth))*(1 - ((1+growth)/(1+rate))**periods))
-
-def pv_growing_annuity_due(pmnt, rate, growth, periods):
-    assert rate!=growth, "rate must not equal growht!"
-    return pmnt * (1+rate) * ((1/(rate-growth))*(1 - ((1+growth)/(1+rate))**periods))
+run = metrics.start_run()
+if metrics.is_enabled() and os.environ.get('PENSION_METRICS_PORT'):
+    metrics.serve(int(os.environ['PENSION_METRICS_PORT']))
 
 st.set_page_config(
     page_title="Pension Planning Calculator",
@@ -54,6 +43,8 @@ with st.sidebar:
     with st.expander("Retirement Parameters"):
         retirement_age = st.selectbox('Retirement Age:', tuple(i for i in range(55,75,1)), index=10, help="At what age do you plan to retire?")
         life_expectancy = st.selectbox('Terminal Year:', tuple(i for i in range(55,115,1)), index=45, help="When do you estimate to stop withdrawing from your pension account?")
+        payment_frequency = st.selectbox('Payment Frequency:', ('Yearly', 'Monthly'), help="""How often you deposit to and withdraw from your pension account.
+            With monthly payments, returns are converted to effective monthly rates and the amounts shown are true monthly amounts.""")
 
     with st.expander("Inflation and Taxes"):
         inf_annual_post = st.number_input("Annualized Inflation Rate (%): ", min_value=0.0, format='%f', value=3.8, help="""Inflation in this version of the calculator is static and is used
@@ -76,27 +67,18 @@ with st.sidebar:
             For example, the average annualized return ot the Standard & Poor's 500 Index (S&P 500) from 1957 through Dec. 31, 2022, is 10.15%.
             **Keep in mind that historical returns are no guarantee of future returns!**""")
 
-        
+    with st.expander("Simulation"):
+        simulate = st.checkbox("Simulate variable returns and inflation", help="""Instead of constant rates, draw thousands of possible market and inflation paths
+            (normally distributed around the rates above) and see how often your plan survives them.""")
+        return_volatility = st.number_input("Return Volatility (%): ", min_value=0.0, format='%f', value=15.0, help="""The annual standard deviation of your portfolio returns.
+            For example, the S&P 500 has had an annual standard deviation of roughly 15%.""")
+        inflation_volatility = st.number_input("Inflation Volatility (%): ", min_value=0.0, format='%f', value=1.0, help="""The annual standard deviation of inflation.""")
+        simulation_paths = st.selectbox('Simulated Paths:', (1000, 10000, 100000), index=1, help="More paths give smoother results but take longer.")
 
-if market_rate_pre_retirement == growth_pre_retirement:
-    st.error("""Error! `Pre-Retirement Return` must be different than `Annual growth of your deposits`""")
-    st.stop()
-
-if market_rate_post_retirement == growth_post_retirement:
-    st.error("""Error! `Post-Retirement Return` must be different than `Annual growth of your withdrawals`""")
-    st.stop()
+    with st.expander("Sensitivity"):
+        show_sensitivity = st.checkbox("Show the deposit over returns and retirement ages", help="""A heatmap of the required monthly deposit for pre-retirement returns from 2% to 12%
+        and retirement ages from 55 to 74, with all other inputs as they are.""")
 
-today_date = datetime.now().date()
-age = today_date.year - birth_date.year - ((today_date.month, today_date.day) < (birth_date.month, birth_date.day))
-this_year_birthday = today_date.replace(month=birth_date.month, day=birth_date.day)
-next_year_birthday = this_year_birthday + relativedelta(years=1)
-most_resent_birthday = this_year_birthday - relativedelta(years=1) if today_date < this_year_birthday else this_year_birthday
-
-retirement_date = birth_date + relativedelta(years=retirement_age)
-years_to_retirement = retirement_date.year - most_resent_birthday.year
-
-terminal_date = birth_date + relativedelta(years=life_expectancy)
-count_down_years = terminal_date.year - retirement_date.year
 
 tax_rate = tax_rate / 100.0
 growth_post_retirement = growth_post_retirement / 100.0
@@ -105,74 +87,47 @@ market_rate_post_retirement = market_rate_post_retirement / 100.0
 growth_pre_retirement = growth_pre_retirement / 100.0
 market_rate_pre_retirement = market_rate_pre_retirement / 100.0
 
-annual_cost_now_net = 12 * monthly_cost_now_net
-monthly_needed_at_retirement_net = monthly_cost_now_net * (1+inf_annual_post)**years_to_retirement
-annual_needed_at_retirement_net = monthly_needed_at_retirement_net * 12
-annual_needed_at_retirement_gross = annual_needed_at_retirement_net * (1 + tax_rate)
-
-
-pv_pension_growing_annuity = Annuity(gr=Rate(market_rate_post_retirement), n=count_down_years, gprog=(growth_post_retirement)).pv() * annual_needed_at_retirement_gross
-
-pv_pension_most_resent_birthday = pv_pension_growing_annuity /(1+market_rate_pre_retirement)**(years_to_retirement-1)
-initial_annual_deposit_amount = pmnt_growing_annuity(pv_pension_most_resent_birthday - initial_amount_for_pension, market_rate_pre_retirement, growth_pre_retirement, years_to_retirement)
-initial_annual_deposit_amount = initial_annual_deposit_amount if initial_annual_deposit_amount >= 0 else -1
-
-time_range_from_now_to_death = pd.to_datetime(pd.Series([f'{i}-{most_resent_birthday.month}-{most_resent_birthday.day}' for i in range(most_resent_birthday.year, terminal_date.year, 1)]),format='%Y-%m-%d')
-pension_plan = pd.DataFrame(index=time_range_from_now_to_death)
-pension_plan.index = pension_plan.index.date
-pension_plan['Age'] = [age + i for i in range(0, pension_plan.shape[0])]
-pension_plan['Growth'] = [0,1] + [1+growth_pre_retirement] * (years_to_retirement-2) + [1+growth_post_retirement] * count_down_years
-pension_plan['Rate'] = [1+market_rate_pre_retirement] * years_to_retirement + [1+market_rate_post_retirement] * count_down_years
-pension_plan['Balance'] = np.zeros(pension_plan.shape[0])
-pension_plan['CF'] = np.zeros(pension_plan.shape[0])
-previous_year_cf_pre_retirement = -initial_annual_deposit_amount
-previous_year_cf_post_retirement = annual_needed_at_retirement_gross
-previous_year_balance_amount = 0
-for year in pension_plan.index:
-    rate = pension_plan.Rate[year]
-    growth = pension_plan.Growth[year]
-    if year == most_resent_birthday: # Initial Lump sum
-        pension_plan.CF.loc[year] = -initial_amount_for_pension
-        previous_year_balance_amount = pension_plan.Balance.loc[year] = initial_amount_for_pension
-        continue
-    if year < retirement_date:
-        previous_year_cf_pre_retirement = pension_plan.CF.loc[year] = previous_year_cf_pre_retirement * growth
-        previous_year_balance_amount = pension_plan.Balance.loc[year] = abs(previous_year_balance_amount) * rate + abs(pension_plan.CF[year])
-        continue
-    if year == retirement_date:
-        pension_plan.CF.loc[year] = annual_needed_at_retirement_gross + (previous_year_cf_pre_retirement * growth)
-        previous_year_balance_amount = pension_plan.Balance.loc[year] = (abs(previous_year_balance_amount) * rate) + abs(previous_year_cf_pre_retirement * growth) - annual_needed_at_retirement_gross
-        continue
-    if year > retirement_date:
-        previous_year_cf_post_retirement = pension_plan.CF.loc[year] = previous_year_cf_post_retirement * growth
-        previous_year_balance_amount = pension_plan.Balance.loc[year] = (abs(previous_year_balance_amount) * rate) - pension_plan.CF[year]
-        continue
+scenario = engine.scenario(birth_date, monthly_cost_now_net, initial_amount_for_pension, retirement_age, life_expectancy,
+                           inf_annual_post, growth_pre_retirement, growth_post_retirement, tax_rate,
+                           market_rate_pre_retirement, market_rate_post_retirement,
+                           periods_per_year=12 if payment_frequency == 'Monthly' else 1)
+try:
+    plan, pension_plan, pension_balance, pre_pension_balance = cache.schedules(scenario)
+except ValueError as e:
+    st.error(f"""Error! {e}""")
+    st.stop()
+
+age = plan.age
+most_resent_birthday = plan.most_recent_birthday
+retirement_date = plan.retirement_date
+terminal_date = plan.terminal_date
+years_to_retirement = plan.years_to_retirement
+count_down_years = plan.count_down_years
+annual_cost_now_net = plan.annual_cost_now_net
+monthly_needed_at_retirement_net = plan.monthly_needed_at_retirement_net
+annual_needed_at_retirement_net = plan.annual_needed_at_retirement_net
+annual_needed_at_retirement_gross = plan.annual_needed_at_retirement_gross
+pv_pension_most_resent_birthday = plan.pv_pension_most_recent_birthday
+initial_annual_deposit_amount = plan.initial_annual_deposit_amount
+monthly_deposit_amount = plan.deposit_per_period if scenario.periods_per_year == 12 else initial_annual_deposit_amount/12
+payment_name = "monthly" if scenario.periods_per_year == 12 else "annual"
+if scenario.periods_per_year == 12:
+    balance_note = ("The amount shown per year is _after_ you have withdrawn the first monthly payment of that year, "
+                    "so it still holds the other eleven payments of the year.")
+    last_payment_date = terminal_date - relativedelta(months=1)
+else:
+    balance_note = "The amount shown per year is _after_ you have withdrawn your annual payment."
+    last_payment_date = terminal_date - relativedelta(years=1)
 
 st.header("**Do you save enough?**")
-if initial_annual_deposit_amount/12 >= 0:
-    st.markdown(f"""<h2 style='text-align: center; color: black;'>You should be saving at least {initial_annual_deposit_amount/12:.2f} per month</h2>""", unsafe_allow_html=True)
+if monthly_deposit_amount >= 0:
+    st.markdown(f"""<h2 style='text-align: center; color: black;'>You should be saving at least {monthly_deposit_amount:.2f} per month</h2>""", unsafe_allow_html=True)
 else:
     st.markdown(f"""<h2 style='text-align: center; color: black;'>No need to save more! Good to go with the existing balance!</h2>""", unsafe_allow_html=True)
 
-fig = make_subplots(rows=2, cols=1, subplot_titles=("CashFlows", "Account Balance"))
-fig.add_trace(
-    go.Bar(x=pension_plan.Age, y=pension_plan.CF),
-    row=1, col=1
-)
-
-fig.add_trace(
-    go.Bar(x=pension_plan.Age, y=pension_plan.Balance),
-    row=2, col=1
-)
-
-fig.update_layout(height=1000,
-                  title_text='',
-                  title_x=0.5,
-                  showlegend=False)
-fig.update_xaxes(title_text="Age", tickmode='linear')
-fig.update_yaxes(title_text="Amount", row=1, col=1)
-fig.update_yaxes(title_text="Amount", row=2, col=1)
-st.plotly_chart(fig, use_container_width=True, theme="streamlit")
+fig = render.schedule_figure(pension_plan.Age, pension_plan.CF, pension_plan.Balance, title='', year=pension_plan.year, periods_per_year=scenario.periods_per_year)
+with metrics.stage('chart.emit'):
+    st.plotly_chart(fig, use_container_width=True, theme="streamlit")
 
 st.header("**Current Financial Situation**")
 
@@ -189,20 +144,6 @@ Let's move on to the next section and visualise what will happen when you are in
 
 st.header("**While In Pension**")
 
-time_range_from_retirement_to_death = pd.to_datetime(pd.Series([f'{retirement_date.year + i}-{retirement_date.month}-{retirement_date.day}' for i in range(0,terminal_date.year-retirement_date.year,1)]),format='%Y-%m-%d')
-pension_balance = pd.DataFrame(data=[annual_needed_at_retirement_gross]*time_range_from_retirement_to_death.shape[0], columns=["Outflow"], index=time_range_from_retirement_to_death)
-pension_balance['Age'] = [age+years_to_retirement + i for i in range(0, pension_balance.shape[0])]
-pension_balance['InflationFactor'] = pd.Series([(1+growth_post_retirement)**i for i in range(0, time_range_from_retirement_to_death.shape[0], 1)]).values
-pension_balance['InflatedOutflow'] = pension_balance['InflationFactor'] * pension_balance['Outflow']
-assert annual_needed_at_retirement_gross * (1+growth_post_retirement)**(time_range_from_retirement_to_death.shape[0]-1) == pension_balance['InflatedOutflow'][-1]
-pension_balance['Rate'] = [market_rate_post_retirement] * pension_balance.shape[0]
-pension_balance['Balance'] = np.ones(pension_balance.shape[0])
-previous_year_balance = pv_pension_growing_annuity
-for year in pension_balance.index:
-    withdrawn_amount = pension_balance.InflatedOutflow[year]
-    rate = pension_balance.Rate[year]
-    previous_year_balance = pension_balance.Balance[year] = (previous_year_balance * (1+rate)) - withdrawn_amount
-
 st.markdown(f"""
 It's important to mention that due to the time value of money, \$1 today is worth more than \$1 in a year from now. This is due to inflation.
 For example, with an inflation rate of 10%, the same product you bought for \$1 today will cost \$1.10 in a year.
@@ -227,41 +168,28 @@ That means that at the beginning of the second year after retirement ({retiremen
 need to pay yourself {annual_needed_at_retirement_gross * (1+growth_post_retirement)**1:.2f},
 the third year ({retirement_date+relativedelta(years=2)}) {annual_needed_at_retirement_gross * (1+growth_post_retirement)**2:,.2f} and so on.
 At the start of the terminal year ({terminal_date-relativedelta(years=1)}) you will need
-an whopping annual amount of {pension_balance['InflatedOutflow'][-1]:,.2f} :cold_sweat:.
+an whopping annual amount of {annual_needed_at_retirement_gross * (1+growth_post_retirement)**(count_down_years-1):,.2f} :cold_sweat:.
 
 All these annual payments will need to be somehow financed, of cource! The second part of the graph below shows
 the optimal balance of your pension account at the beginning of each year.
-The amount shown per year is _after_ you have withdrawn your annual payment.
+{balance_note}
 
 On {retirement_date} you should have a total of {pension_balance.Balance[0]:,.2f} :open_mouth:.
 The day before ({retirement_date-relativedelta(days=1)}) the balance should be {pension_balance.Balance[0] + pension_balance.InflatedOutflow[0]:,.2f}.
 
-The last payment date is on {terminal_date-relativedelta(years=1)}, and you should see a 0 balance in your account (since you withdrew the last annual payment).
+The last payment date is on {last_payment_date}, and you should see a 0 balance in your account (since you withdrew the last {payment_name} payment).
 """)
 
-fig = make_subplots(rows=2, cols=1, subplot_titles=("CashFlows", "Account Balance"))
-fig.add_trace(
-    go.Bar(x=pension_balance.Age, y=pension_balance.InflatedOutflow),
-    row=1, col=1
-)
-
-fig.add_trace(
-    go.Bar(x=pension_balance.Age, y=pension_balance.Balance),
-    row=2, col=1
-)
-
-fig.update_layout(height=1000, title_text="Retirement CFs & Balance", showlegend=False)
-fig.update_xaxes(title_text="Age", tickmode='linear')
-fig.update_yaxes(title_text="Amount", row=1, col=1)
-fig.update_yaxes(title_text="Amount", row=2, col=1)
-st.plotly_chart(fig, use_container_width=True, theme="streamlit")
+fig = render.schedule_figure(pension_balance.Age, pension_balance.InflatedOutflow, pension_balance.Balance, title="Retirement CFs & Balance", year=pension_balance.year, periods_per_year=scenario.periods_per_year)
+with metrics.stage('chart.emit'):
+    st.plotly_chart(fig, use_container_width=True, theme="streamlit")
 
 st.header("**The path towards retirement**")
 # assert pension_balance.Balance[0].round(2) + pension_balance.InflatedOutflow[0].round(2) == pre_pension_balance.Balance[-1].round(2) # The balance we have in the account when we first get into pension is after we have taken out the first pension payment 
 
 st.markdown(f"""
 Well, we know that just the day before {retirement_date}, you will need to have a total of {pension_balance.Balance[0] + pension_balance.InflatedOutflow[0]:,.2f} in your
-pension account. On {retirement_date} you will withdraw the first pension annual amount of {pension_balance.InflatedOutflow[0]:,.2f}, leaving you with {pension_balance.Balance[0]:,.2f}).
+pension account. On {retirement_date} you will withdraw the first pension {payment_name} amount of {pension_balance.InflatedOutflow[0]:,.2f}, leaving you with {pension_balance.Balance[0]:,.2f}).
 
 To achieve this plan, you need to invest. That is usually done by placing the money in an investment account.
 You estimate an annual rate of return of {market_rate_pre_retirement*100.0:.2f}% from your investments.
@@ -274,40 +202,56 @@ account again and could retire properly on {retirement_date}.
 However, your current balance is {initial_amount_for_pension:,.2f}, and in order to reach your target,
 you will need to be depositing money to your account.
 
-So far, you have to be depositing **{initial_annual_deposit_amount/12:,.2f} per month** ({initial_annual_deposit_amount:,.2f} annual) to your
+So far, you have to be depositing **{monthly_deposit_amount:,.2f} per month** ({initial_annual_deposit_amount:,.2f} annual) to your
 account, and each time you celebrate your next birthday, you should be increasing that amount by {growth_pre_retirement*100:.2f}%.
 """)
 
-time_range_from_now_to_retirement = pd.to_datetime(pd.Series([f'{i}-{retirement_date.month}-{retirement_date.day}' for i in range(most_resent_birthday.year, retirement_date.year+1,1)]),format='%Y-%m-%d')
-pre_pension_balance = pd.DataFrame(data=[-initial_amount_for_pension] + [-initial_annual_deposit_amount * (1+growth_pre_retirement)** i for i in range(0, time_range_from_now_to_retirement.shape[0]-1, 1)], columns=["Depositions"], index=time_range_from_now_to_retirement)
-pre_pension_balance['Age'] = [age + i for i in range(0, pre_pension_balance.shape[0])]
-pre_pension_balance['Rate'] = [1+market_rate_pre_retirement] * pre_pension_balance.shape[0]
-pre_pension_balance['Balance'] = np.zeros(pre_pension_balance.shape[0])
-previous_year_amount = 0
-for year in pre_pension_balance.index:
-    depo = pre_pension_balance.Depositions[year]
-    rate = pre_pension_balance.Rate[year]
-    if year == most_resent_birthday:
-        previous_year_amount = pre_pension_balance.Balance[year] = - depo
-        continue
-    previous_year_amount = pre_pension_balance.Balance[year] = previous_year_amount*rate - depo
-
-fig = make_subplots(rows=2, cols=1, subplot_titles=("CashFlows", "Account Balance"))
-fig.add_trace(
-    go.Bar(x=pre_pension_balance.Age, y=pre_pension_balance.Depositions),
-    row=1, col=1
-)
-
-fig.add_trace(
-    go.Bar(x=pre_pension_balance.Age, y=pre_pension_balance.Balance),
-    row=2, col=1
-)
-
-fig.update_layout(height=1000, title_text="Pre-Retirement CFs & Balance", showlegend=False)
-fig.update_xaxes(title_text="Age", tickmode='linear')
-fig.update_yaxes(title_text="Amount", row=1, col=1)
-fig.update_yaxes(title_text="Amount", row=2, col=1)
-st.plotly_chart(fig, use_container_width=True, theme="streamlit")
+fig = render.schedule_figure(pre_pension_balance.Age, pre_pension_balance.Depositions, pre_pension_balance.Balance, title="Pre-Retirement CFs & Balance", year=pre_pension_balance.year, periods_per_year=scenario.periods_per_year)
+with metrics.stage('chart.emit'):
+    st.plotly_chart(fig, use_container_width=True, theme="streamlit")
+
+if show_sensitivity:
+    st.header("**What if returns or your retirement age change?**")
+
+    grid = sensitivity.surface(scenario)
+    st.markdown(f"""
+Each cell below is computed for a different pre-retirement return (rows) and retirement age (columns), with all your other inputs unchanged.
+The cross marks your current choice. You can either see the monthly deposit you would need, or the balance left in your terminal year
+if you keep depositing {grid.annual_deposit:,.2f} a year (growing by {growth_pre_retirement*100:.2f}% per year) whatever happens.
+""")
+    view = st.radio("Show:", ("Required monthly deposit", "Terminal balance with your current deposit"), horizontal=True)
+    if view == "Required monthly deposit":
+        fig = render.heatmap_figure(grid.retirement_ages, grid.rates * 100, grid.monthly_deposit, x_title="Retirement Age",
+                                    y_title="Return (%)", z_title="Monthly Deposit", reverse=True,
+                                    marker=(retirement_age, market_rate_pre_retirement * 100))
+    else:
+        fig = render.heatmap_figure(grid.retirement_ages, grid.rates * 100, grid.terminal_balance, x_title="Retirement Age",
+                                    y_title="Return (%)", z_title="Terminal Balance", zmid=0,
+                                    marker=(retirement_age, market_rate_pre_retirement * 100))
+    with metrics.stage('chart.emit'):
+        st.plotly_chart(fig, use_container_width=True, theme="streamlit")
+
+if simulate:
+    st.header("**What if markets vary?**")
+
+    simulation = cache.simulate(scenario, paths=simulation_paths, volatility=return_volatility / 100.0,
+                                inflation_volatility=inflation_volatility / 100.0, seed=0,
+                                workers=None if simulation_paths >= montecarlo.POOL_PATHS else 1)
+
+    st.markdown(f"""
+So far, returns and inflation have been constant every single year. In reality, they vary, and the order in which good and bad years arrive matters.
+
+We simulated {simulation.paths:,} possible lifetimes of your plan, with an annual return volatility of {return_volatility:.2f}% and an inflation volatility of {inflation_volatility:.2f}%.
+You keep depositing {max(monthly_deposit_amount, 0):,.2f} per month (growing by {growth_pre_retirement*100:.2f}% per year), and your withdrawals follow the inflation of each path.
+
+In **{simulation.success_probability*100:.1f}%** of them, your account never runs out of money.
+The graph below shows the range of your account balance at each age: the darker area covers the middle half of the paths, and the lighter one 90% of them.
+""")
+
+    bands = dict(zip(simulation.percentiles, simulation.bands))
+    fig = render.bands_figure(simulation.age, bands)
+    with metrics.stage('chart.emit'):
+        st.plotly_chart(fig, use_container_width=True, theme="streamlit")
 
 st.header("**Conclusion**")
 
@@ -326,3 +270,12 @@ html_buy_me_coffee = """<a href="https://www.buymeacoffee.com/invsnippets"><img
 
 st.markdown(html_buy_me_coffee, unsafe_allow_html=True)
 
+if metrics.is_enabled():
+    with st.expander("Debug: stage timings", expanded=False):
+        st.caption("Stages recorded in this rerun. Stages may nest: a simulation includes its summary. "
+                   "Memory is measured for the whole process, so blocks and peak bytes are left blank "
+                   "for stages that overlapped another session's.")
+        st.dataframe([dict(sample._asdict(), ms=sample.seconds * 1000) for sample in run.samples], use_container_width=True)
+        st.json(run.counters)
+        st.download_button("Download as JSON lines", metrics.log_lines(run), file_name="timings.jsonl")
+        st.download_button("Download totals (Prometheus)", metrics.prometheus(), file_name="metrics.prom")
@@ -0,0 +1,37 @@
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+from tmval import Annuity, Rate
+
+from pension.annuity import FactorTable, factor_table, growing_annuity_factor
+
+
+@pytest.mark.parametrize('rate, growth, n', [(0.1, 0.0375, 35), (0.0025, 0.1, 1), (0.2, 0.0, 80), (0.05, 0.05, 30), (0.0, 0.02, 12)])
+def test_table_matches_tmval_on_the_grid(rate, growth, n):
+    table = factor_table()
+    assert table(rate, growth, n) == pytest.approx(Annuity(gr=Rate(rate), n=n, gprog=growth).pv(), rel=1e-12)
+
+
+def test_table_matches_tmval_over_a_sample_of_the_grid():
+    table = factor_table()
+    rng = np.random.default_rng(0)
+    rates, growths, periods = rng.integers(0, 81, 40) * 0.0025, rng.integers(0, 41, 40) * 0.0025, rng.integers(1, 81, 40)
+    expected = [Annuity(gr=Rate(r), n=int(n), gprog=g).pv() for r, g, n in zip(rates, growths, periods)]
+    np.testing.assert_allclose(table(rates, growths, periods), expected, rtol=1e-12)
+
+
+def test_off_grid_values_are_computed():
+    table = FactorTable(max_periods=10)
+    rates = np.array([0.1015, -0.01, 0.3, 0.05, 0.05])
+    growths = np.array([0.038, 0.02, 0.0, 0.02, 0.02])
+    periods = np.array([35, 5, 5, 20, 2.5])
+    np.testing.assert_array_equal(table(rates, growths, periods), growing_annuity_factor(rates, growths, periods))
+    assert table(0.1015, 0.038, 35) == growing_annuity_factor(0.1015, 0.038, 35)
+
+
+def test_compute_path_skips_heavy_imports():
+    code = ("import sys, pension.cache, pension.render, pension.sensitivity; "
+            "print(' '.join(m for m in ('pandas', 'plotly', 'tmval', 'scipy', 'numpy_financial') if m in sys.modules))")
+    assert subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout.strip() == ''
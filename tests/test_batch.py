@@ -0,0 +1,60 @@
+from datetime import date
+
+import numpy as np
+import pytest
+from tmval import Annuity, Rate
+
+from pension import batch, engine
+from pension.annuity import growing_annuity_factor
+from tests.test_engine import SCENARIOS
+
+
+def test_matches_engine_row_by_row():
+    columns = {field: np.array([getattr(s, field) for s in SCENARIOS])
+               for field in engine.Scenario._fields if field != 'periods_per_year'}
+    result = batch.evaluate(**columns)
+    for i, s in enumerate(SCENARIOS):
+        p = engine.summarize(s)
+        assert result.age[i] == p.age
+        assert result.years_to_retirement[i] == p.years_to_retirement
+        assert result.count_down_years[i] == p.count_down_years
+        assert result.pv_pension_growing_annuity[i] == pytest.approx(p.pv_pension_growing_annuity)
+        assert result.pv_pension_most_recent_birthday[i] == pytest.approx(p.pv_pension_most_recent_birthday)
+        assert result.initial_annual_deposit_amount[i] == pytest.approx(max(p.initial_annual_deposit_amount, 0))
+        assert result.monthly_deposit_amount[i] == pytest.approx(max(p.initial_annual_deposit_amount, 0) / 12)
+        assert result.overfunded[i] == (p.initial_annual_deposit_amount < 0)
+
+
+def test_scalars_broadcast_against_columns():
+    retirement_age = np.arange(55, 75)
+    result = batch.evaluate(date(1980, 1, 1), 2500.0, 30000.0, retirement_age, 100,
+                            0.038, 0.038, 0.038, 0.0, 0.1015, 0.1015, today_date=date(2023, 6, 15))
+    assert result.monthly_deposit_amount.shape == retirement_age.shape
+    # retiring later always needs smaller deposits
+    assert np.all(np.diff(result.monthly_deposit_amount) < 0)
+
+
+def test_ages_handle_birthdays_before_1970():
+    births = np.array(['1950-12-31', '1950-01-01', '1969-06-15'], dtype='datetime64[D]')
+    np.testing.assert_array_equal(batch.ages(births, date(2023, 6, 15)), [72, 73, 54])
+
+
+def test_overfunded_rows_deposit_nothing():
+    result = batch.evaluate(date(1980, 1, 1), 2500.0, [0.0, 5e6], 65, 100,
+                            0.038, 0.038, 0.038, 0.0, 0.1015, 0.1015, today_date=date(2023, 6, 15))
+    np.testing.assert_array_equal(result.overfunded, [False, True])
+    assert result.initial_annual_deposit_amount[0] > 0
+    assert result.initial_annual_deposit_amount[1] == result.monthly_deposit_amount[1] == 0
+
+
+def test_invalid_rows_are_nan():
+    result = batch.evaluate(date(1980, 1, 1), 2500.0, 0.0, [65, 44, 65], [100, 100, 65],
+                            0.03, 0.02, 0.02, 0.0, 0.07, 0.05, today_date=date(2023, 6, 15))
+    assert np.isfinite(result.initial_annual_deposit_amount[0])
+    assert np.isnan(result.initial_annual_deposit_amount[1:]).all()
+    assert not result.overfunded.any()
+
+
+@pytest.mark.parametrize('rate, growth, n', [(0.1015, 0.038, 35), (0.05, 0.05, 30), (0.02, 0.06, 12)])
+def test_annuity_factor_matches_tmval(rate, growth, n):
+    assert growing_annuity_factor(rate, growth, n) == pytest.approx(Annuity(gr=Rate(rate), n=n, gprog=growth).pv())
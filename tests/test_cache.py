@@ -0,0 +1,66 @@
+import datetime
+
+import numpy as np
+
+from pension import cache, engine
+from tests.test_engine import SCENARIOS
+
+
+class Clock:
+    now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_evicts_least_recently_used():
+    lru = cache.LRUCache(maxsize=2)
+    lru.put('a', 1)
+    lru.put('b', 2)
+    assert lru.get('a') == 1
+    lru.put('c', 3)
+    assert lru.get('b') is None
+    assert lru.get('a') == 1 and lru.get('c') == 3
+    assert lru.info() == cache.CacheInfo(hits=3, misses=1, maxsize=2, currsize=2, ttl=None)
+
+
+def test_entries_expire_after_ttl():
+    clock = Clock()
+    lru = cache.LRUCache(ttl=10, clock=clock)
+    lru.put('a', 1)
+    clock.now = 9.9
+    assert lru.get('a') == 1
+    clock.now = 10
+    assert lru.get('a') is None
+    assert len(lru) == 0
+
+
+def test_memoize_counts_hits_and_misses():
+    calls = []
+
+    @cache.memoize(lambda x: round(x, 6), maxsize=4)
+    def square(x):
+        calls.append(x)
+        return x * x
+
+    assert square(0.1 + 0.2) == square(0.3) == (0.1 + 0.2) ** 2
+    assert calls == [0.1 + 0.2]
+    assert square.cache_info().hits == 1 and square.cache_info().misses == 1
+    square.cache_clear()
+    assert square.cache_info().currsize == 0
+
+
+def test_equivalent_scenarios_share_a_key():
+    s = SCENARIOS[1]
+    same = s._replace(birth_date=datetime.datetime(1980, 1, 1), retirement_age=np.int64(65),
+                      market_rate_pre_retirement=np.float64(s.market_rate_pre_retirement))
+    assert cache.scenario_key(s) == cache.scenario_key(same)
+    assert cache.scenario_key(s) != cache.scenario_key(s._replace(retirement_age=66))
+
+
+def test_project_is_cached():
+    cache.project.cache_clear()
+    first = cache.project(SCENARIOS[2])
+    assert cache.project(SCENARIOS[2]) is first
+    assert cache.project.cache_info()[:2] == (1, 1)
+    assert first.plan == engine.summarize(SCENARIOS[2])
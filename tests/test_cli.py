@@ -0,0 +1,60 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pension import batch, cli, engine
+from tests.test_engine import SCENARIOS
+
+TODAY = date(2023, 6, 15)
+
+
+@pytest.fixture
+def clients(tmp_path):
+    frame = pd.DataFrame([s._asdict() for s in SCENARIOS]).drop(columns=['today_date', 'periods_per_year'])
+    frame.insert(0, 'client', [f'c{i}' for i in range(len(frame))])
+    path = tmp_path / 'clients.csv'
+    frame.to_csv(path, index=False)
+    return path
+
+
+def test_results_do_not_depend_on_chunking(clients, tmp_path):
+    assert cli.run(clients, tmp_path / 'one.csv', chunk_size=100, today_date=TODAY) == len(SCENARIOS)
+    cli.run(clients, tmp_path / 'many.csv', chunk_size=4, today_date=TODAY)
+    one, many = pd.read_csv(tmp_path / 'one.csv'), pd.read_csv(tmp_path / 'many.csv')
+    pd.testing.assert_frame_equal(one, many)
+    assert list(one.client) == [f'c{i}' for i in range(len(SCENARIOS))]
+    assert list(one.columns[-len(batch.Batch._fields):]) == list(batch.Batch._fields)
+
+
+def test_schedules_follow_the_engine(clients, tmp_path):
+    cli.run(clients, tmp_path / 'out.csv', tmp_path / 'schedules.csv', chunk_size=4, today_date=TODAY)
+    schedules = pd.read_csv(tmp_path / 'schedules.csv')
+    for row in (1, 2, 4):
+        s = SCENARIOS[row]._replace(today_date=TODAY)
+        plan = engine.project(s).pension_plan
+        expected = plan.Balance.to_numpy()
+        schedule = schedules[schedules.row == row]
+        np.testing.assert_array_equal(schedule.age, plan.Age)
+        if row != 4:  # over-funded: no deposits instead of the -1 sentinel
+            np.testing.assert_allclose(schedule.balance, expected, atol=0.005)
+
+
+def test_parquet_round_trip(clients, tmp_path):
+    pytest.importorskip('pyarrow')
+    parquet = tmp_path / 'clients.parquet'
+    pd.read_csv(clients).to_parquet(parquet)
+    cli.main([str(parquet), str(tmp_path / 'out.parquet'), '--schedules', str(tmp_path / 'schedules.parquet'),
+              '--chunk-size', '2', '--today', TODAY.isoformat()])
+    cli.run(clients, tmp_path / 'out.csv', chunk_size=100, today_date=TODAY)
+    out = pd.read_parquet(tmp_path / 'out.parquet')
+    np.testing.assert_allclose(out.monthly_deposit_amount, pd.read_csv(tmp_path / 'out.csv').monthly_deposit_amount)
+    assert pd.read_parquet(tmp_path / 'schedules.parquet').row.max() == len(SCENARIOS) - 1
+
+
+def test_missing_columns_are_reported(tmp_path):
+    path = tmp_path / 'bad.csv'
+    pd.DataFrame({'birth_date': ['1980-01-01']}).to_csv(path, index=False)
+    with pytest.raises(SystemExit):
+        cli.main([str(path), str(tmp_path / 'out.csv')])
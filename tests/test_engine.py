@@ -0,0 +1,211 @@
+from datetime import date
+from pathlib import Path
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+from tmval import Annuity, Rate
+
+from pension import engine
+from pension.annuity import pmnt_growing_annuity
+
+
+def loop_projection(s):
+    """The original per-year loops from streamlit_app.py, kept as the reference."""
+    p = engine.summarize(s)
+    age, most_resent_birthday = p.age, p.most_recent_birthday
+    retirement_date, terminal_date = p.retirement_date, p.terminal_date
+    years_to_retirement, count_down_years = p.years_to_retirement, p.count_down_years
+    growth_pre_retirement, growth_post_retirement = s.growth_pre_retirement, s.growth_post_retirement
+    market_rate_pre_retirement, market_rate_post_retirement = s.market_rate_pre_retirement, s.market_rate_post_retirement
+    initial_amount_for_pension = s.initial_amount_for_pension
+
+    annual_needed_at_retirement_gross = 12 * s.monthly_cost_now_net * (1+s.inf_annual_post)**years_to_retirement * (1 + s.tax_rate)
+    pv_pension_growing_annuity = Annuity(gr=Rate(market_rate_post_retirement), n=count_down_years, gprog=(growth_post_retirement)).pv() * annual_needed_at_retirement_gross
+    pv_pension_most_resent_birthday = pv_pension_growing_annuity /(1+market_rate_pre_retirement)**(years_to_retirement-1)
+    initial_annual_deposit_amount = pmnt_growing_annuity(pv_pension_most_resent_birthday - initial_amount_for_pension, market_rate_pre_retirement, growth_pre_retirement, years_to_retirement)
+    initial_annual_deposit_amount = initial_annual_deposit_amount if initial_annual_deposit_amount >= 0 else -1
+
+    time_range_from_now_to_death = pd.to_datetime(pd.Series([f'{i}-{most_resent_birthday.month}-{most_resent_birthday.day}' for i in range(most_resent_birthday.year, terminal_date.year, 1)]),format='%Y-%m-%d')
+    pension_plan = pd.DataFrame(index=time_range_from_now_to_death)
+    pension_plan.index = pension_plan.index.date
+    pension_plan['Age'] = [age + i for i in range(0, pension_plan.shape[0])]
+    pension_plan['Growth'] = [0,1] + [1+growth_pre_retirement] * (years_to_retirement-2) + [1+growth_post_retirement] * count_down_years
+    pension_plan['Rate'] = [1+market_rate_pre_retirement] * years_to_retirement + [1+market_rate_post_retirement] * count_down_years
+    balance = np.zeros(pension_plan.shape[0])
+    cf = np.zeros(pension_plan.shape[0])
+    previous_year_cf_pre_retirement = -initial_annual_deposit_amount
+    previous_year_cf_post_retirement = annual_needed_at_retirement_gross
+    previous_year_balance_amount = 0
+    for i, year in enumerate(pension_plan.index):
+        rate = pension_plan.Rate[year]
+        growth = pension_plan.Growth[year]
+        if year == most_resent_birthday:
+            cf[i] = -initial_amount_for_pension
+            previous_year_balance_amount = balance[i] = initial_amount_for_pension
+            continue
+        if year < retirement_date:
+            previous_year_cf_pre_retirement = cf[i] = previous_year_cf_pre_retirement * growth
+            previous_year_balance_amount = balance[i] = abs(previous_year_balance_amount) * rate + abs(cf[i])
+            continue
+        if year == retirement_date:
+            cf[i] = annual_needed_at_retirement_gross + (previous_year_cf_pre_retirement * growth)
+            previous_year_balance_amount = balance[i] = (abs(previous_year_balance_amount) * rate) + abs(previous_year_cf_pre_retirement * growth) - annual_needed_at_retirement_gross
+            continue
+        if year > retirement_date:
+            previous_year_cf_post_retirement = cf[i] = previous_year_cf_post_retirement * growth
+            previous_year_balance_amount = balance[i] = (abs(previous_year_balance_amount) * rate) - cf[i]
+            continue
+    pension_plan['Balance'] = balance
+    pension_plan['CF'] = cf
+
+    time_range_from_retirement_to_death = pd.to_datetime(pd.Series([f'{retirement_date.year + i}-{retirement_date.month}-{retirement_date.day}' for i in range(0,terminal_date.year-retirement_date.year,1)]),format='%Y-%m-%d')
+    pension_balance = pd.DataFrame(data=[annual_needed_at_retirement_gross]*time_range_from_retirement_to_death.shape[0], columns=["Outflow"], index=time_range_from_retirement_to_death)
+    pension_balance['Age'] = [age+years_to_retirement + i for i in range(0, pension_balance.shape[0])]
+    pension_balance['InflationFactor'] = pd.Series([(1+growth_post_retirement)**i for i in range(0, time_range_from_retirement_to_death.shape[0], 1)]).values
+    pension_balance['InflatedOutflow'] = pension_balance['InflationFactor'] * pension_balance['Outflow']
+    pension_balance['Rate'] = [market_rate_post_retirement] * pension_balance.shape[0]
+    balance = np.ones(pension_balance.shape[0])
+    previous_year_balance = pv_pension_growing_annuity
+    for i, year in enumerate(pension_balance.index):
+        withdrawn_amount = pension_balance.InflatedOutflow[year]
+        rate = pension_balance.Rate[year]
+        previous_year_balance = balance[i] = (previous_year_balance * (1+rate)) - withdrawn_amount
+    pension_balance['Balance'] = balance
+
+    time_range_from_now_to_retirement = pd.to_datetime(pd.Series([f'{i}-{retirement_date.month}-{retirement_date.day}' for i in range(most_resent_birthday.year, retirement_date.year+1,1)]),format='%Y-%m-%d')
+    pre_pension_balance = pd.DataFrame(data=[-initial_amount_for_pension] + [-initial_annual_deposit_amount * (1+growth_pre_retirement)** i for i in range(0, time_range_from_now_to_retirement.shape[0]-1, 1)], columns=["Depositions"], index=time_range_from_now_to_retirement)
+    pre_pension_balance['Age'] = [age + i for i in range(0, pre_pension_balance.shape[0])]
+    pre_pension_balance['Rate'] = [1+market_rate_pre_retirement] * pre_pension_balance.shape[0]
+    balance = np.zeros(pre_pension_balance.shape[0])
+    previous_year_amount = 0
+    for i, year in enumerate(pre_pension_balance.index):
+        depo = pre_pension_balance.Depositions[year]
+        rate = pre_pension_balance.Rate[year]
+        if year == most_resent_birthday:
+            previous_year_amount = balance[i] = - depo
+            continue
+        previous_year_amount = balance[i] = previous_year_amount*rate - depo
+    pre_pension_balance['Balance'] = balance
+
+    return pension_plan, pension_balance, pre_pension_balance
+
+
+SCENARIOS = [
+    # the app defaults
+    engine.Scenario(date(1980, 1, 1), 0.0, 0.0, 65, 100, 0.038, 0.038, 0.038, 0.0, 0.1015, 0.1015, date(2023, 6, 15)),
+    engine.Scenario(date(1980, 1, 1), 2500.0, 30000.0, 65, 100, 0.038, 0.038, 0.038, 0.0, 0.1015, 0.1015, date(2023, 6, 15)),
+    engine.Scenario(date(1975, 9, 30), 4000.0, 120000.0, 60, 90, 0.025, 0.02, 0.03, 0.15, 0.07, 0.04, date(2024, 2, 1)),
+    engine.Scenario(date(1990, 3, 12), 1800.0, 5000.0, 74, 114, 0.05, 0.0, 0.05, 0.25, 0.12, 0.06, date(2023, 3, 12)),
+    # already over-funded: the deposit collapses to the -1 sentinel
+    engine.Scenario(date(1970, 12, 31), 1000.0, 5e6, 57, 80, 0.02, 0.01, 0.02, 0.1, 0.05, 0.03, date(2023, 1, 1)),
+    # under-funded retirement row, exercising the abs() carry-over
+    engine.Scenario(date(1985, 5, 5), 3000.0, 0.0, 67, 95, 0.03, 0.05, 0.0, 0.0, 0.02, 0.15, date(2023, 11, 20)),
+]
+
+
+@pytest.mark.parametrize('s', SCENARIOS)
+def test_matches_loop_to_the_cent(s):
+    projection = engine.project(s)
+    expected = loop_projection(s)
+    for got, want in zip(projection[1:], expected):
+        assert list(got.columns) == list(want.columns)
+        assert list(got.index) == list(want.index)
+        for column in want.columns:
+            np.testing.assert_allclose(got[column], want[column], rtol=0, atol=0.005, err_msg=column)
+
+
+def test_pension_balance_withdraws_inflated_outflow():
+    s = SCENARIOS[1]
+    p, _, pension_balance, _ = engine.project(s)
+    last = p.annual_needed_at_retirement_gross * (1 + s.growth_post_retirement) ** (p.count_down_years - 1)
+    assert pension_balance.InflatedOutflow.iloc[-1] == pytest.approx(last)
+    assert pension_balance.Balance.iloc[-1] == pytest.approx(0, abs=0.005)
+
+
+def test_compound_broadcasts_over_leading_axes():
+    rates = np.array([[1.1, 1.1, 1.1], [1.0, 1.0, 1.0]])
+    flows = np.array([[1.0, 1.0, 1.0], [-1.0, -1.0, -1.0]])
+    np.testing.assert_allclose(engine.compound([10.0, 10.0], rates, flows),
+                               [[12.0, 14.2, 16.62], [9.0, 8.0, 7.0]])
+
+
+def test_rejects_retirement_in_the_past():
+    s = SCENARIOS[1]._replace(retirement_age=43)
+    with pytest.raises(ValueError):
+        engine.summarize(s)
+
+
+@pytest.mark.parametrize('m', [2, 4, 12])
+def test_periods_keep_the_annual_plan(m):
+    s = SCENARIOS[1]
+    annual, periodic = engine.project(s), engine.project(s._replace(periods_per_year=m))
+    ytr = annual.plan.years_to_retirement
+    assert periodic.plan[:13] == annual.plan[:13]
+    assert len(periodic.pension_plan) == len(annual.pension_plan) * m
+    np.testing.assert_allclose(periodic.pension_plan.Balance.iloc[:ytr * m:m], annual.pension_plan.Balance.iloc[:ytr], atol=0.005)
+    np.testing.assert_allclose(periodic.pre_pension_balance.Balance.iloc[::m], annual.pre_pension_balance.Balance, atol=0.005)
+    assert periodic.pension_plan.Balance.iloc[-1] == pytest.approx(0, abs=0.005)
+    assert periodic.pension_balance.Balance.iloc[-1] == pytest.approx(0, abs=0.005)
+    # after retirement each anniversary still holds the rest of that year's withdrawals
+    period_rate = engine.period_rates(1 + s.market_rate_post_retirement, m)[0]
+    rest = periodic.pension_balance.InflatedOutflow.iloc[::m].to_numpy() * sum(period_rate ** -np.arange(1, m))
+    np.testing.assert_allclose(periodic.pension_balance.Balance.iloc[::m], annual.pension_balance.Balance + rest, atol=0.005)
+    np.testing.assert_allclose(periodic.pension_plan.Balance.iloc[ytr * m::m], annual.pension_plan.Balance.iloc[ytr:] + rest, atol=0.005)
+
+
+def test_monthly_payments_account_for_interest_within_the_year():
+    p = engine.summarize(SCENARIOS[1]._replace(periods_per_year=12))
+    assert 0 < p.deposit_per_period < p.initial_annual_deposit_amount / 12
+    assert p.withdrawal_per_period > p.annual_needed_at_retirement_gross / 12
+
+
+def test_period_dates_clip_to_month_end():
+    dates = engine.anniversaries(2023, 1, 31, 4, 12)
+    assert [d.day for d in dates] == [31, 28, 31, 30]
+    assert engine.anniversaries(2024, 2, 29, 2)[1] == pd.Timestamp(2025, 2, 28)
+
+
+def test_periods_must_divide_a_year():
+    with pytest.raises(ValueError):
+        engine.summarize(SCENARIOS[1]._replace(periods_per_year=5))
+
+
+def recorded_projections():
+    """Digests of every SCENARIOS projection with 1, 2, 4 and 12 periods per year,
+    recorded from the DataFrame engine before it kept compact Schedules (6717b01)."""
+    with open(Path(__file__).parent / 'data' / 'projections.json') as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize('m', [1, 2, 4, 12])
+def test_schedules_match_recorded_projections(m):
+    recorded = recorded_projections()
+    for i, s in enumerate(SCENARIOS):
+        projection = engine.project(s._replace(periods_per_year=m))
+        for name in ('pension_plan', 'pension_balance', 'pre_pension_balance'):
+            expected, frame = recorded[f'{i}/{m}/{name}'], getattr(projection, name)
+            dates = pd.DatetimeIndex(frame.index)
+            assert list(frame.columns) == expected['columns'] and len(frame) == expected['length']
+            assert [str(dates[0].date()), str(dates[-1].date())] == expected['dates']
+            np.testing.assert_allclose(frame.sum(), expected['sums'], rtol=1e-9, atol=1e-6)
+            np.testing.assert_allclose(frame.iloc[expected['rows']], expected['values'], rtol=1e-9, atol=1e-6)
+
+
+@pytest.mark.parametrize('m', [1, 12])
+def test_schedules_are_compact_projections(m):
+    s = SCENARIOS[1]._replace(periods_per_year=m)
+    compact, frames = engine.schedules(s), engine.project(s)
+    assert compact.plan == frames.plan
+    for schedule, frame in zip(compact[1:], frames[1:]):
+        assert list(schedule.dates().date) == list(pd.DatetimeIndex(frame.index).date)
+        assert schedule.year.dtype == np.int16 and len(schedule) == len(frame)
+        assert 'Age' in schedule.names and 'Age' not in schedule.columns
+        assert schedule.nbytes < frame.memory_usage(deep=True).sum() / 2
+    balance = compact.pension_balance
+    assert isinstance(balance.columns['Rate'], float)
+    assert balance.columns['InflationFactor'].size == compact.plan.count_down_years
+    np.testing.assert_array_equal(balance.InflatedOutflow, frames.pension_balance.InflatedOutflow)
+    with pytest.raises(AttributeError):
+        balance.Missing
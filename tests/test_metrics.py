@@ -0,0 +1,132 @@
+import json
+import threading
+import tracemalloc
+
+import pytest
+
+from pension import cache, engine, metrics
+from tests.test_engine import SCENARIOS
+
+
+@pytest.fixture
+def enabled():
+    metrics.reset()
+    metrics.enable()
+    yield
+    metrics.disable()
+    metrics.reset()
+
+
+def test_disabled_records_nothing():
+    metrics.reset()
+    run = metrics.start_run()
+    engine.project(SCENARIOS[0])
+    with metrics.stage('chart.emit'):
+        pass
+    metrics.count('cache.project.hits')
+    assert run.samples == [] and run.counters == {}
+    assert 'stage=' not in metrics.prometheus()
+
+
+def test_records_each_stage(enabled):
+    run = metrics.start_run()
+    engine.project(SCENARIOS[0])
+    assert [sample.stage for sample in run.samples] == [
+        'summarize', 'project.pension_plan', 'project.pension_balance', 'project.pre_pension_balance']
+    assert all(sample.seconds > 0 and sample.peak_bytes is None for sample in run.samples)
+
+
+def test_counts_cache_hits(enabled):
+    cache.project.cache_clear()
+    run = metrics.start_run()
+    cache.project(SCENARIOS[0])
+    cache.project(SCENARIOS[0])
+    assert run.counters == {'cache.project.misses': 1, 'cache.project.hits': 1}
+    assert [sample.stage for sample in run.samples].count('normalize') == 2
+
+
+def test_runs_are_per_thread(enabled):
+    run = metrics.start_run()
+    thread = threading.Thread(target=lambda: (metrics.start_run(), engine.summarize(SCENARIOS[0])))
+    thread.start()
+    thread.join()
+    assert run.samples == []
+    assert 'pension_stage_calls_total{stage="summarize"} 1' in metrics.prometheus()
+
+
+def test_overlapping_threads_leave_memory_blank(enabled):
+    metrics.enable(trace_memory=True)
+    barrier, runs = threading.Barrier(2), {}
+
+    def work(name, size):
+        runs[name] = metrics.start_run()
+        with metrics.stage('work'):
+            barrier.wait()
+            kept = [bytearray(1000) for _ in range(size)]
+            barrier.wait()
+        del kept
+
+    threads = [threading.Thread(target=work, args=args) for args in (('busy', 10_000), ('idle', 0))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # the idle run must not be charged with the busy run's allocations
+    for run in runs.values():
+        (sample,) = run.samples
+        assert sample.blocks is None and sample.peak_bytes is None
+    run = metrics.start_run()
+    with metrics.stage('alone'):
+        pass
+    assert run.samples[0].blocks is not None and run.samples[0].peak_bytes is not None
+    assert 'pension_stage_allocated_blocks{stage="work"}' not in metrics.prometheus()
+
+
+def test_nested_peaks_cover_inner_stages(enabled):
+    metrics.enable(trace_memory=True)
+    run = metrics.start_run()
+    with metrics.stage('outer'):
+        with metrics.stage('inner'):
+            buffer = bytearray(1_000_000)
+        del buffer
+    inner, outer = run.samples
+    assert inner.peak_bytes >= 1_000_000
+    assert outer.peak_bytes >= inner.peak_bytes
+
+
+def test_exports(enabled):
+    run = metrics.start_run()
+    with metrics.stage('chart.emit'):
+        pass
+    metrics.count('cache.project.hits', 2)
+    lines = [json.loads(line) for line in metrics.log_lines(run).splitlines()]
+    assert lines[0]['stage'] == 'chart.emit'
+    assert lines[1] == {'counter': 'cache.project.hits', 'value': 2}
+    text = metrics.prometheus()
+    assert '# TYPE pension_stage_seconds_total counter' in text
+    assert 'pension_stage_calls_total{stage="chart.emit"} 1' in text
+    assert 'pension_cache_project_hits_total 2' in text
+    assert '# TYPE pension_stage_allocated_blocks gauge' in text
+
+
+def test_blocks_gauge_keeps_the_latest_call(enabled):
+    run = metrics.start_run()
+    for size in (100, 0):
+        with metrics.stage('alloc'):
+            kept = [[] for _ in range(size)]
+    line = next(line for line in metrics.prometheus().splitlines() if line.startswith('pension_stage_allocated_blocks{'))
+    assert int(line.split()[-1]) == run.samples[-1].blocks
+    del kept
+
+
+def test_disable_leaves_foreign_tracing_alone():
+    tracemalloc.start()
+    try:
+        metrics.enable(trace_memory=True)
+        metrics.disable()
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+    metrics.enable(trace_memory=True)
+    metrics.disable()
+    assert not tracemalloc.is_tracing()
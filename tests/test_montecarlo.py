@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from pension import engine, montecarlo
+from tests.test_engine import SCENARIOS
+
+
+@pytest.mark.parametrize('model', ['normal', 'lognormal'])
+def test_zero_volatility_follows_the_plan(model):
+    s = SCENARIOS[1]
+    sim = montecarlo.simulate(s, paths=50, model=model, volatility=0, inflation_volatility=0)
+    plan = engine.project(s).pension_plan
+    np.testing.assert_array_equal(sim.age, plan.Age)
+    for band in sim.bands:
+        np.testing.assert_allclose(band, plan.Balance, atol=0.005)
+    assert sim.success_probability == 1
+
+
+def test_constant_history_follows_the_plan(tmp_path):
+    s = SCENARIOS[1]
+    path = tmp_path / 'history.csv'
+    path.write_text('year,return,inflation\n' + ''.join(f'{y},0.1015,0.038\n' for y in range(1960, 1990)))
+    sim = montecarlo.simulate(s, paths=20, model='bootstrap', history=montecarlo.load_history(path), block=7)
+    np.testing.assert_allclose(sim.bands[2], engine.project(s).pension_plan.Balance, atol=0.005)
+
+
+def test_seeded_runs_do_not_depend_on_workers():
+    s = SCENARIOS[2]
+    serial = montecarlo.simulate(s, paths=3000, chunk_size=1000, seed=7)
+    pooled = montecarlo.simulate(s, paths=3000, chunk_size=1000, seed=7, workers=2)
+    assert serial.success_probability == pooled.success_probability
+    np.testing.assert_array_equal(serial.bands, pooled.bands)
+    assert 0 < serial.success_probability < 1
+    pool = montecarlo._pool
+    montecarlo.simulate(s, paths=2000, chunk_size=1000, seed=7, workers=2)
+    assert montecarlo._pool is pool is not None
+
+
+def test_bands_are_ordered():
+    sim = montecarlo.simulate(SCENARIOS[1], paths=2000, seed=3)
+    assert sim.bands.shape == (5, sim.age.size)
+    assert np.all(np.diff(sim.bands, axis=0) >= 0)
+
+
+def test_bootstrap_needs_history():
+    with pytest.raises(ValueError):
+        montecarlo.simulate(SCENARIOS[1], model='bootstrap')
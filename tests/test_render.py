@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+from pension import engine, montecarlo, render
+from tests.test_engine import SCENARIOS
+
+
+def built_figure(x, cash_flows, balance, title):
+    """The figure as the app used to build it, one property at a time."""
+    fig = make_subplots(rows=2, cols=1, subplot_titles=("CashFlows", "Account Balance"))
+    fig.add_trace(go.Bar(x=x, y=cash_flows), row=1, col=1)
+    fig.add_trace(go.Bar(x=x, y=balance), row=2, col=1)
+    fig.update_layout(height=1000, title_text=title, showlegend=False)
+    fig.update_xaxes(title_text="Age", tickmode='linear')
+    fig.update_yaxes(title_text="Amount", row=1, col=1)
+    fig.update_yaxes(title_text="Amount", row=2, col=1)
+    return fig
+
+
+def test_aggregate():
+    values = np.arange(1.0, 8.0)
+    np.testing.assert_array_equal(render.aggregate(values, 3, 'sum'), [6, 15, 7])
+    np.testing.assert_array_equal(render.aggregate(values, 3, 'first'), [1, 4, 7])
+    np.testing.assert_array_equal(render.aggregate(values, 3, 'last'), [3, 6, 7])
+    assert render.aggregate(values, 1, 'sum') is values
+
+
+def test_schedule_figure_matches_built_figure():
+    plan = engine.project(SCENARIOS[0]).pre_pension_balance
+    title = "Pre-Retirement CFs & Balance"
+    expected = built_figure(plan.Age, plan.Depositions, plan.Balance, title)
+    fig = render.schedule_figure(plan.Age.to_numpy(), plan.Depositions.to_numpy(), plan.Balance.to_numpy(), title=title)
+    assert fig.layout == expected.layout
+    for trace, expected_trace in zip(fig.data, expected.data):
+        assert isinstance(trace.y, np.ndarray)
+        np.testing.assert_array_equal(trace.x, expected_trace.x)
+        np.testing.assert_array_equal(trace.y, expected_trace.y)
+        assert (trace.type, trace.xaxis, trace.yaxis) == (expected_trace.type, expected_trace.xaxis, expected_trace.yaxis)
+
+
+def test_templates_are_reused_and_not_shared():
+    first = render.schedule_figure(np.arange(3), np.ones(3), np.ones(3), title='T')
+    first.update_layout(height=10)
+    second = render.schedule_figure(np.arange(3), np.ones(3), np.ones(3), title='T')
+    assert second.layout.height == 1000
+    assert render._schedule_template.cache_info().hits >= 1
+
+
+@pytest.mark.parametrize('m', [2, 12])
+def test_monthly_schedule_is_drawn_per_year(m):
+    s = SCENARIOS[1]
+    annual, periodic = engine.schedules(s), engine.schedules(s._replace(periods_per_year=m))
+    ytr = annual.plan.years_to_retirement
+    deposit_share = m * engine.period_rates(1 + s.market_rate_pre_retirement, m)[1]
+    withdrawal_share = m * engine.period_rates(1 + s.market_rate_post_retirement, m)[2]
+    # each bar holds the nominal sum of its year's payments, which are worth the annual one
+    depositions = annual.pre_pension_balance.Depositions * np.concatenate(([1], np.full(ytr, deposit_share)))
+    withdrawals = annual.pension_balance.InflatedOutflow * withdrawal_share
+    cash_flows = np.zeros(len(annual.pension_plan))
+    cash_flows[:ytr + 1] += depositions
+    cash_flows[ytr:] += withdrawals
+    for name, column, expected in (('pre_pension_balance', 'Depositions', depositions),
+                                   ('pension_balance', 'InflatedOutflow', withdrawals),
+                                   ('pension_plan', 'CF', cash_flows)):
+        schedule, yearly = getattr(periodic, name), getattr(annual, name)
+        fig = render.schedule_figure(schedule.Age, schedule.column(column), schedule.Balance, year=schedule.year, periods_per_year=m)
+        np.testing.assert_allclose(fig.data[0].x, yearly.Age)
+        np.testing.assert_allclose(fig.data[0].y, expected, rtol=1e-12)
+        np.testing.assert_array_equal(fig.data[1].y, schedule.Balance[::m])
+
+
+def test_long_series_are_capped():
+    age = np.arange(2000.0)
+    fig = render.schedule_figure(age, np.ones(2000), age, max_points=300)
+    assert len(fig.data[0].x) <= 300
+    assert fig.data[0].y.sum() == 2000
+
+
+def test_bands_figure():
+    simulation = montecarlo.simulate(SCENARIOS[0], paths=200, seed=0)
+    bands = dict(zip(simulation.percentiles, simulation.bands))
+    fig = render.bands_figure(simulation.age, bands)
+    np.testing.assert_array_equal(fig.data[-1].y, bands[50])
+    assert [trace.fill for trace in fig.data] == [None, 'tonexty', None, 'tonexty', None]
+
+
+def test_heatmap_figure():
+    z = np.arange(6.0).reshape(2, 3)
+    fig = render.heatmap_figure([55, 56, 57], [2.0, 2.5], z, marker=(56, 2.1), zmid=0)
+    np.testing.assert_array_equal(fig.data[0].z, z)
+    assert fig.data[0].zmid == 0
+    assert (tuple(fig.data[1].x), tuple(fig.data[1].y)) == ((56,), (2.1,))
+    assert render.heatmap_figure([55], [2.0], [[1.0]]).data[1].x == ()
@@ -0,0 +1,69 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+from pension import engine, sensitivity, solver
+
+SCENARIO = engine.Scenario(date(1980, 1, 1), 2500.0, 50000.0, 65, 100, 0.038, 0.038, 0.038, 0.0, 0.1015, 0.07, date(2023, 6, 15))
+
+
+def test_cells_match_the_engine():
+    grid = sensitivity.surface(SCENARIO)
+    assert grid.monthly_deposit.shape == (grid.rates.size, grid.retirement_ages.size) == (21, 20)
+    for i in (0, 10, 20):
+        for j in (0, 10, 19):
+            s = SCENARIO._replace(market_rate_pre_retirement=grid.rates[i], retirement_age=int(grid.retirement_ages[j]))
+            deposit = engine.summarize(s).initial_annual_deposit_amount
+            assert grid.monthly_deposit[i, j] == pytest.approx(max(deposit, 0) / 12, rel=1e-12)
+
+
+@pytest.mark.parametrize('m', [1, 12])
+def test_own_cell_is_the_headline_deposit(m):
+    s = SCENARIO._replace(periods_per_year=m)
+    grid = sensitivity.surface(s, rates=[0.05, s.market_rate_pre_retirement])
+    j = int(np.flatnonzero(grid.retirement_ages == s.retirement_age)[0])
+    p = engine.summarize(s)
+    expected = p.deposit_per_period if m == 12 else p.initial_annual_deposit_amount / 12
+    assert grid.monthly_deposit[1, j] == pytest.approx(expected, rel=1e-12)
+
+
+def test_terminal_balance_matches_solver():
+    grid = sensitivity.surface(SCENARIO)
+    assert grid.annual_deposit == pytest.approx(engine.summarize(SCENARIO).initial_annual_deposit_amount)
+    # with equal pre- and post-retirement rates the solver's schedule is the engine's
+    i = int(np.flatnonzero(grid.rates == SCENARIO.market_rate_post_retirement)[0])
+    for j in (0, 10, 19):
+        s = SCENARIO._replace(market_rate_pre_retirement=grid.rates[i], retirement_age=int(grid.retirement_ages[j]))
+        p = engine.summarize(s)
+        rates, growth = solver.schedule(s)
+        expected = solver.terminal_balance(grid.annual_deposit, s.initial_amount_for_pension, p.annual_needed_at_retirement_gross,
+                                           rates, growth, p.years_to_retirement)
+        assert grid.terminal_balance[i, j] == pytest.approx(float(expected), rel=1e-9)
+
+
+def test_own_cell_ends_at_zero():
+    grid = sensitivity.surface(SCENARIO, rates=[0.05, SCENARIO.market_rate_pre_retirement])
+    j = int(np.flatnonzero(grid.retirement_ages == SCENARIO.retirement_age)[0])
+    assert grid.terminal_balance[1, j] == pytest.approx(0, abs=1e-6)
+
+
+def test_too_early_retirement_is_nan():
+    grid = sensitivity.surface(SCENARIO._replace(birth_date=date(1962, 1, 1)))
+    too_early = grid.retirement_ages < 63
+    assert np.isnan(grid.monthly_deposit[:, too_early]).all()
+    assert np.isnan(grid.terminal_balance[:, too_early]).all()
+    assert np.isfinite(grid.monthly_deposit[:, ~too_early]).all()
+
+
+def test_only_new_rows_are_evaluated(monkeypatch):
+    s = SCENARIO._replace(tax_rate=0.123)
+    evaluated = []
+    evaluate = sensitivity._evaluate
+    monkeypatch.setattr(sensitivity, '_evaluate', lambda s, rates, *args: evaluated.append(rates.size) or evaluate(s, rates, *args))
+    first = sensitivity.surface(s, rates=[0.02, 0.03])
+    moved = sensitivity.surface(s._replace(market_rate_pre_retirement=0.05, retirement_age=60), rates=[0.02, 0.03])
+    sensitivity.surface(s, rates=[0.02, 0.03, 0.04])
+    assert evaluated == [2, 1]
+    np.testing.assert_array_equal(first.monthly_deposit, moved.monthly_deposit)
+    assert moved.annual_deposit != first.annual_deposit
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from pension import engine, solver
+from tests.test_engine import SCENARIOS
+
+
+def test_matches_closed_form_for_constant_rates():
+    s = SCENARIOS[1]
+    assert solver.solve(s) == pytest.approx(engine.summarize(s).initial_annual_deposit_amount)
+
+
+def test_rate_equal_to_growth():
+    s = SCENARIOS[1]._replace(market_rate_pre_retirement=0.05, market_rate_post_retirement=0.05,
+                              growth_pre_retirement=0.05, growth_post_retirement=0.05)
+    p = engine.summarize(s)
+    assert solver.solve(s) == pytest.approx(p.initial_annual_deposit_amount)
+    assert engine.project(s).pension_plan.Balance.iloc[-1] == pytest.approx(0, abs=0.005)
+
+
+def test_arbitrary_schedule_zeroes_the_terminal_balance():
+    s = SCENARIOS[2]
+    p = engine.summarize(s)
+    years = p.years_to_retirement + p.count_down_years - 1
+    rng = np.random.default_rng(0)
+    rates, growth = rng.uniform(-0.05, 0.15, years), rng.uniform(0, 0.05, years)
+    deposit = solver.solve(s, rates=rates, growth=growth)
+    balance = solver.terminal_balance(deposit, s.initial_amount_for_pension, p.annual_needed_at_retirement_gross,
+                                      rates, growth, p.years_to_retirement)
+    assert balance == pytest.approx(0, abs=1e-6)
+
+
+def test_solves_many_scenarios_at_once():
+    rng = np.random.default_rng(1)
+    n, years = 1000, 40
+    start = rng.uniform(0, 1e5, n)
+    withdrawal = rng.uniform(1e4, 1e5, n)
+    retirement_row = rng.integers(2, 30, n)
+    rates = rng.normal(0.07, 0.1, (n, years))
+    growth = rng.uniform(0, 0.04, (n, years))
+    deposit = solver.required_deposit(start, withdrawal, rates, growth, retirement_row)
+    assert deposit.shape == (n,)
+    np.testing.assert_allclose(solver.terminal_balance(deposit, start, withdrawal, rates, growth, retirement_row), 0, atol=1e-5)
+    i = 17
+    assert deposit[i] == pytest.approx(solver.required_deposit(start[i], withdrawal[i], rates[i], growth[i], retirement_row[i]))
+
+
+def test_no_deposit_years_is_nan():
+    assert np.isnan(solver.required_deposit(0.0, 1000.0, np.full(5, 0.05), np.zeros(5), 0))